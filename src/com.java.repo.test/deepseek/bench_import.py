@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Import-time benchmark for the DeepSeek client module.
+
+Each sample runs a fresh interpreter that imports `test` and constructs a
+DeepSeekClient, timed with `-X importtime`. The script fails if the median
+import time exceeds the budget or if the import pulled in the OpenAI SDK.
+
+Usage:
+    python bench_import.py [--budget-ms 150] [--runs 9]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+PROBE = """
+import sys, time
+import test
+assert "openai" not in sys.modules, "importing test pulled in openai"
+started = time.perf_counter()
+test.DeepSeekClient(api_key="bench")
+print("construct_us", int((time.perf_counter() - started) * 1e6))
+print("openai_loaded", "openai" in sys.modules)
+"""
+
+
+def run_once():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        cwd=HERE,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    import_us = None
+    for line in result.stderr.splitlines():
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) == 3 and parts[2] == "test":
+            import_us = int(parts[1])
+    stats = dict(line.split() for line in result.stdout.splitlines())
+    return import_us, int(stats["construct_us"]), stats["openai_loaded"] == "True"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=150.0, help="maximum median import time")
+    parser.add_argument("--runs", type=int, default=9, help="number of fresh interpreters to sample")
+    args = parser.parse_args()
+
+    samples = [run_once() for _ in range(args.runs)]
+    import_ms = statistics.median(sample[0] for sample in samples) / 1000.0
+    construct_ms = statistics.median(sample[1] for sample in samples) / 1000.0
+    eager = any(sample[2] for sample in samples)
+
+    print(f"import test:            {import_ms:8.1f} ms (median of {args.runs}, budget {args.budget_ms:.0f} ms)")
+    print(f"DeepSeekClient(...):    {construct_ms:8.1f} ms")
+    print(f"openai loaded by init:  {eager}")
+
+    if eager:
+        print("FAIL: constructing DeepSeekClient imported the OpenAI SDK")
+        return 1
+    if import_ms > args.budget_ms:
+        print("FAIL: import time is over budget")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
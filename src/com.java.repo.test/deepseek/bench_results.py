@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+CPU and memory cost of DeepSeekClient result types against the local fake
+endpoint (fake_server.py).
+
+For each result_type ("completion", "result", "dict") the same sequential
+requests are sent and the script reports the calling thread's CPU time per
+request (the fake server runs on another thread), the
+peak traced allocation per request and the memory retained per response
+when --keep responses are held, as a classification job collecting results
+would. CPU time is the median over --rounds rounds that interleave the
+result types in rotating order, so drift in machine speed does not favour
+whichever type runs first.
+
+Usage:
+    python bench_results.py --requests 500 --keep 1000
+    python bench_results.py --completion-tokens 400
+"""
+
+import argparse
+import statistics
+import sys
+import time
+import tracemalloc
+
+from fake_server import FakeDeepSeekServer
+from test import RESULT_TYPES, DeepSeekClient
+
+MESSAGES = [{"role": "user", "content": "Classify this ticket: the invoice total is wrong."}]
+
+
+def cpu_per_request(clients, requests, rounds):
+    """Median calling-thread CPU seconds per request for each client, over interleaved rounds."""
+    for client in clients.values():
+        for _ in range(20):
+            client.chat_completion(MESSAGES)
+    samples = {result_type: [] for result_type in clients}
+    batch = max(1, requests // rounds)
+    order = list(clients)
+    for round_index in range(rounds):
+        for result_type in order[round_index % len(order):] + order[:round_index % len(order)]:
+            started = time.thread_time()
+            for _ in range(batch):
+                clients[result_type].chat_completion(MESSAGES)
+            samples[result_type].append((time.thread_time() - started) / batch)
+    return {result_type: statistics.median(values) for result_type, values in samples.items()}
+
+
+def measure_memory(client, keep):
+    tracemalloc.start()
+    peaks = []
+    for _ in range(20):
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        client.chat_completion(MESSAGES)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    baseline = tracemalloc.get_traced_memory()[0]
+    kept = [client.chat_completion(MESSAGES) for _ in range(keep)]
+    retained = (tracemalloc.get_traced_memory()[0] - baseline) / keep
+    tracemalloc.stop()
+    del kept
+    return int(statistics.median(peaks)), int(retained)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500, help="requests timed per result type")
+    parser.add_argument("--rounds", type=int, default=10, help="interleaved rounds the requests are split into")
+    parser.add_argument("--keep", type=int, default=1000, help="responses held to measure retained memory")
+    parser.add_argument("--completion-tokens", type=int, default=16)
+    args = parser.parse_args()
+
+    results = []
+    with FakeDeepSeekServer(completion_tokens=args.completion_tokens) as server:
+        clients = {
+            result_type: DeepSeekClient(api_key="bench", base_url=server.base_url, max_retries=0, result_type=result_type)
+            for result_type in RESULT_TYPES
+        }
+        cpu = cpu_per_request(clients, args.requests, args.rounds)
+        for result_type, client in clients.items():
+            peak, retained = measure_memory(client, args.keep)
+            results.append({
+                "result_type": result_type,
+                "cpu_us_per_request": cpu[result_type] * 1e6,
+                "peak_alloc_bytes_per_request": peak,
+                "retained_bytes_per_response": retained
+            })
+
+    baseline = results[0]
+    print(f"{'result_type':<12}{'cpu us/req':>12}{'peak alloc':>12}{'retained':>12}")
+    for row in results:
+        print(
+            f"{row['result_type']:<12}{row['cpu_us_per_request']:>12.0f}"
+            f"{row['peak_alloc_bytes_per_request']:>12}{row['retained_bytes_per_response']:>12}"
+        )
+    for row in results[1:]:
+        print(
+            f"{row['result_type']}: {1 - row['cpu_us_per_request'] / baseline['cpu_us_per_request']:.0%} less CPU, "
+            f"{1 - row['retained_bytes_per_response'] / baseline['retained_bytes_per_response']:.0%} less retained memory"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for DeepSeekClient calling styles against the local
+fake endpoint (fake_server.py).
+
+Modes:
+    sync          chat_completion, one request at a time
+    threads       chat_completion on a ThreadPoolExecutor
+    async         async_chat_completion with N concurrent tasks
+    stream        stream_response on a ThreadPoolExecutor
+    async-stream  async_stream_response with N concurrent tasks
+    stream-deltas, async-stream-deltas
+                  the same with deltas=True (SSE fast-path decoding)
+
+Every (mode, concurrency) cell runs in a fresh interpreter so peak RSS is not
+shared between cells. Each cell reports req/s, p50/p95/p99 latency, time to
+first token (streaming modes), peak RSS and peak traced allocation per
+request. Results are written as JSON tagged with the current git commit, and
+--compare prints the change against an earlier results file.
+
+Usage:
+    python bench_throughput.py --concurrency 1,8,32 --requests 400 --output bench.json
+    python bench_throughput.py --compare bench-main.json --output bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MODES = ("sync", "threads", "async", "stream", "async-stream", "stream-deltas", "async-stream-deltas")
+MESSAGES = [
+    {"role": "system", "content": "You are a helpful assistant."},
+    {"role": "user", "content": "Summarise the benchmark in one sentence."}
+]
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100.0))]
+
+
+def run_cell(mode, concurrency, requests, base_url):
+    """Run one benchmark cell in this process and return its result dict."""
+    from test import DeepSeekClient, StreamAssembler
+
+    client = DeepSeekClient(api_key="bench", base_url=base_url, max_retries=0)
+    streaming = mode.startswith(("stream", "async-stream"))
+    deltas = mode.endswith("-deltas")
+
+    def one_sync():
+        started = time.perf_counter()
+        if streaming:
+            assembler = StreamAssembler()
+            for _ in client.stream_response(MESSAGES, assembler=assembler, deltas=deltas):
+                pass
+            return time.perf_counter() - started, assembler.metrics["time_to_first_token"]
+        client.chat_completion(MESSAGES)
+        return time.perf_counter() - started, None
+
+    async def one_async():
+        started = time.perf_counter()
+        if streaming:
+            assembler = StreamAssembler()
+            async for _ in client.async_stream_response(MESSAGES, assembler=assembler, deltas=deltas):
+                pass
+            return time.perf_counter() - started, assembler.metrics["time_to_first_token"]
+        await client.async_chat_completion(MESSAGES)
+        return time.perf_counter() - started, None
+
+    async def many_async(count):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def bounded():
+            async with semaphore:
+                return await one_async()
+
+        return await asyncio.gather(*(bounded() for _ in range(count)))
+
+    def many_sync(count):
+        if mode == "sync":
+            return [one_sync() for _ in range(count)]
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(lambda _: one_sync(), range(count)))
+
+    async def measure(run):
+        """Warm up, time the measured run, then sample allocation peaks one request at a time."""
+        await run(min(requests, max(concurrency, 8)))
+        started = time.perf_counter()
+        samples = await run(requests)
+        elapsed = time.perf_counter() - started
+        tracemalloc.start()
+        alloc_peaks = []
+        for _ in range(10):
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            await run(1)
+            alloc_peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+        tracemalloc.stop()
+        return samples, elapsed, alloc_peaks
+
+    if mode.startswith("async"):
+        samples, elapsed, alloc_peaks = asyncio.run(measure(many_async))
+    else:
+        async def run_sync(count):
+            return many_sync(count)
+
+        samples, elapsed, alloc_peaks = asyncio.run(measure(run_sync))
+
+    latencies = [sample[0] for sample in samples]
+    ttfts = [sample[1] for sample in samples if sample[1] is not None]
+    return {
+        "mode": mode,
+        "concurrency": concurrency if mode != "sync" else 1,
+        "requests": requests,
+        "req_per_s": requests / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "ttft_p50_ms": percentile(ttfts, 50) * 1000 if ttfts else None,
+        "ttft_p99_ms": percentile(ttfts, 99) * 1000 if ttfts else None,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "peak_alloc_bytes_per_request": int(statistics.median(alloc_peaks))
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_row(cell):
+    ttft = f"{cell['ttft_p50_ms']:8.1f}" if cell["ttft_p50_ms"] is not None else "       -"
+    return (
+        f"{cell['mode']:<20}{cell['concurrency']:>5}{cell['req_per_s']:>10.1f}"
+        f"{cell['p50_ms']:>9.1f}{cell['p95_ms']:>9.1f}{cell['p99_ms']:>9.1f}{ttft}"
+        f"{cell['peak_rss_kb'] / 1024:>9.1f}{cell['peak_alloc_bytes_per_request'] / 1024:>10.1f}"
+    )
+
+
+def compare(previous, current):
+    before = {(cell["mode"], cell["concurrency"]): cell for cell in previous["results"]}
+    print(f"\nChange vs {previous.get('commit') or 'baseline'}:")
+    print(f"{'mode':<20}{'conc':>5}{'req/s':>10}{'p99':>10}{'alloc':>10}")
+    for cell in current["results"]:
+        old = before.get((cell["mode"], cell["concurrency"]))
+        if old is None:
+            continue
+
+        def delta(key):
+            return (cell[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+
+        print(
+            f"{cell['mode']:<20}{cell['concurrency']:>5}{delta('req_per_s'):>+9.1f}%"
+            f"{delta('p99_ms'):>+9.1f}%{delta('peak_alloc_bytes_per_request'):>+9.1f}%"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--concurrency", default="1,4,16,64")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per cell")
+    parser.add_argument("--latency", default="constant:0.02", help="fake server latency distribution")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="fake server token pacing")
+    parser.add_argument("--completion-tokens", type=int, default=64)
+    parser.add_argument("--base-url", help="benchmark an already running endpoint instead")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    parser.add_argument("--cell", nargs=3, metavar=("MODE", "CONCURRENCY", "BASE_URL"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cell:
+        mode, concurrency, base_url = args.cell
+        print(json.dumps(run_cell(mode, int(concurrency), args.requests, base_url)))
+        return 0
+
+    from fake_server import FakeDeepSeekServer
+
+    modes = [mode for mode in args.modes.split(",") if mode]
+    levels = [int(level) for level in args.concurrency.split(",")]
+    server = FakeDeepSeekServer(
+        latency=args.latency, tokens_per_second=args.tokens_per_second, completion_tokens=args.completion_tokens
+    )
+    results = []
+    print(f"{'mode':<20}{'conc':>5}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'ttft ms':>8}{'rss MB':>9}{'alloc KB':>10}")
+    with server:
+        base_url = args.base_url or server.base_url
+        for mode in modes:
+            for concurrency in (levels if mode != "sync" else [1]):
+                output = subprocess.run(
+                    [sys.executable, __file__, "--requests", str(args.requests), "--cell", mode, str(concurrency), base_url],
+                    cwd=HERE, capture_output=True, text=True, check=True
+                ).stdout
+                cell = json.loads(output.strip().splitlines()[-1])
+                results.append(cell)
+                print(format_row(cell))
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "server": {"latency": args.latency, "tokens_per_second": args.tokens_per_second,
+                   "completion_tokens": args.completion_tokens, "base_url": args.base_url},
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
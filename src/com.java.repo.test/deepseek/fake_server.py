@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the DeepSeek chat-completions endpoint, for offline load
+testing of DeepSeekClient.
+
+Serves POST /chat/completions (and /v1/chat/completions) with plain JSON or
+SSE streaming responses, using only the standard library. Latency, token
+pacing, error and 429 injection are configurable. Point a client at it with:
+
+    client = DeepSeekClient(api_key="local", base_url=server.base_url)
+
+Usage:
+    python fake_server.py --port 8089 --latency lognormal:-1.5,0.5 --tokens-per-second 60
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import threading
+import time
+import uuid
+
+WORDS = (
+    "the quick brown fox jumps over a lazy dog while deep models stream tokens "
+    "back to patient clients across the local loopback interface"
+).split()
+
+REASONS = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found", 429: "Too Many Requests", 500: "Internal Server Error"}
+
+
+def parse_latency(spec, rng=random):
+    """
+    Build a latency sampler (seconds) from a spec string:
+    `constant:S`, `uniform:LO,HI`, `exponential:MEAN` or `lognormal:MU,SIGMA`.
+    """
+    kind, _, args = spec.partition(":")
+    values = [float(value) for value in args.split(",")] if args else []
+    if kind == "constant":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: rng.uniform(values[0], values[1])
+    if kind == "exponential":
+        return lambda: rng.expovariate(1.0 / values[0])
+    if kind == "lognormal":
+        return lambda: rng.lognormvariate(values[0], values[1])
+    raise ValueError(f"Unknown latency distribution: {spec!r}")
+
+
+def count_tokens(messages):
+    return sum(len(str(message.get("content") or "")) // 4 + 4 for message in messages)
+
+
+class FakeDeepSeekServer:
+    """
+    An asyncio HTTP/1.1 server speaking the OpenAI-compatible chat-completions
+    protocol. Use it as a context manager to run it on a background thread.
+
+    Args:
+        host (str, optional): Interface to bind. Defaults to "127.0.0.1".
+        port (int, optional): Port to bind; 0 picks a free one. Defaults to 0.
+        latency (str, optional): Time-to-first-byte distribution, see parse_latency.
+            Defaults to "constant:0".
+        tokens_per_second (float, optional): Completion token pacing; 0 disables it.
+            Defaults to 0.
+        completion_tokens (int, optional): Tokens generated per response, capped by
+            the request's max_tokens. Defaults to 32.
+        error_rate (float, optional): Fraction of requests answered with a 500. Defaults to 0.
+        rate_limit_rate (float, optional): Fraction of requests answered with a 429.
+            Defaults to 0.
+        retry_after (float, optional): Retry-After seconds sent with a 429. Defaults to 1.
+        rejected_keys (iterable, optional): API keys answered with a 401. Defaults to None.
+        seed (int, optional): Seed for the injected randomness. Defaults to None.
+    """
+
+    def __init__(
+            self,
+            host="127.0.0.1",
+            port=0,
+            latency="constant:0",
+            tokens_per_second=0.0,
+            completion_tokens=32,
+            error_rate=0.0,
+            rate_limit_rate=0.0,
+            retry_after=1.0,
+            seed=None,
+            rejected_keys=None
+    ):
+        self.host = host
+        self.port = port
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.rejected_keys = frozenset(rejected_keys or ())
+        self.random = random.Random(seed)
+        self.sample_latency = parse_latency(latency, self.random)
+        self.stats = {"requests": 0, "streams": 0, "errors": 0, "rate_limited": 0, "unauthorized": 0}
+        self._server = None
+        self._connections = set()
+        self._loop = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._start_error = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """Stop accepting connections and drop the open keep-alive ones."""
+        self._server.close()
+        connections = list(self._connections)
+        for task in connections:
+            task.cancel()
+        await asyncio.gather(*connections, return_exceptions=True)
+        await self._server.wait_closed()
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run_in_thread, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._start_error is not None:
+            self._thread.join()
+            raise self._start_error
+        return self
+
+    def __exit__(self, *exc_info):
+        asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def _run_in_thread(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            try:
+                self._loop.run_until_complete(self.start())
+            except BaseException as e:
+                # Re-raised by __enter__, e.g. when the port is already in use
+                self._start_error = e
+                return
+            finally:
+                self._ready.set()
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+
+    async def _handle_connection(self, reader, writer):
+        self._connections.add(asyncio.current_task())
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                method, path, _ = request_line.split(" ", 2)
+                headers = {}
+                for line in header_lines:
+                    if line:
+                        name, _, value = line.partition(":")
+                        headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                api_key = headers.get("authorization", "").partition("Bearer ")[2]
+                if api_key in self.rejected_keys:
+                    self.stats["unauthorized"] += 1
+                    await self._send_json(
+                        writer, 401, {"error": {"message": "Authentication Fails", "type": "authentication_error"}}
+                    )
+                else:
+                    await self._handle_request(method, path, body, writer)
+                if headers.get("connection", "").lower() == "close":
+                    return
+        except (ConnectionError, asyncio.CancelledError):
+            return
+        finally:
+            self._connections.discard(asyncio.current_task())
+            writer.close()
+
+    async def _handle_request(self, method, path, body, writer):
+        if method != "POST" or path.rstrip("/") not in ("/chat/completions", "/v1/chat/completions"):
+            await self._send_json(writer, 404, {"error": {"message": f"No route for {method} {path}"}})
+            return
+        try:
+            request = json.loads(body)
+        except ValueError:
+            await self._send_json(writer, 400, {"error": {"message": "Request body is not valid JSON"}})
+            return
+        self.stats["requests"] += 1
+        await asyncio.sleep(max(0.0, self.sample_latency()))
+
+        roll = self.random.random()
+        if roll < self.rate_limit_rate:
+            self.stats["rate_limited"] += 1
+            await self._send_json(
+                writer, 429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                {"Retry-After": f"{self.retry_after:g}"}
+            )
+            return
+        if roll < self.rate_limit_rate + self.error_rate:
+            self.stats["errors"] += 1
+            await self._send_json(writer, 500, {"error": {"message": "Injected server error"}})
+            return
+
+        model = request.get("model", "deepseek-chat")
+        prompt_tokens = count_tokens(request.get("messages", []))
+        limit = request.get("max_tokens") or math.inf
+        tokens = [
+            (" " if i else "") + WORDS[i % len(WORDS)]
+            for i in range(int(min(self.completion_tokens, limit)))
+        ]
+        finish_reason = "length" if len(tokens) < self.completion_tokens else "stop"
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens),
+            "prompt_cache_hit_tokens": 0,
+            "prompt_cache_miss_tokens": prompt_tokens
+        }
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        if request.get("stream"):
+            self.stats["streams"] += 1
+            include_usage = (request.get("stream_options") or {}).get("include_usage", False)
+            await self._send_stream(writer, completion_id, created, model, tokens, finish_reason, usage, include_usage)
+            return
+
+        if self.tokens_per_second:
+            await asyncio.sleep(len(tokens) / self.tokens_per_second)
+        await self._send_json(writer, 200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens)},
+                "finish_reason": finish_reason,
+                "logprobs": None
+            }],
+            "usage": usage
+        })
+
+    async def _send_json(self, writer, status, payload, extra_headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json", "Content-Length": str(len(body))}
+        headers.update(extra_headers or {})
+        writer.write(self._status_head(status, headers) + body)
+        await writer.drain()
+
+    async def _send_stream(self, writer, completion_id, created, model, tokens, finish_reason, usage, include_usage):
+        headers = {"Content-Type": "text/event-stream", "Cache-Control": "no-cache", "Transfer-Encoding": "chunked"}
+        writer.write(self._status_head(200, headers))
+
+        def chunk(delta, reason=None, chunk_usage=None, choices=True):
+            return {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": reason, "logprobs": None}] if choices else [],
+                "usage": chunk_usage
+            }
+
+        async def send(payload):
+            data = b"data: " + (payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")) + b"\n\n"
+            writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+            await writer.drain()
+
+        interval = 1.0 / self.tokens_per_second if self.tokens_per_second else 0.0
+        await send(chunk({"role": "assistant", "content": ""}))
+        for token in tokens:
+            if interval:
+                await asyncio.sleep(interval)
+            await send(chunk({"content": token}))
+        await send(chunk({}, finish_reason))
+        if include_usage:
+            await send(chunk(None, chunk_usage=usage, choices=False))
+        await send(b"[DONE]")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    @staticmethod
+    def _status_head(status, headers):
+        lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", default="constant:0", help="constant:S | uniform:LO,HI | exponential:MEAN | lognormal:MU,SIGMA")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--completion-tokens", type=int, default=32)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--reject-key", action="append", dest="rejected_keys", default=[], help="API key answered with 401; repeatable")
+    args = parser.parse_args()
+
+    server = FakeDeepSeekServer(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+        rejected_keys=args.rejected_keys
+    )
+    print(f"Serving fake DeepSeek API on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
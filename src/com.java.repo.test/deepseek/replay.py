@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+Record DeepSeekClient traffic and replay it for load tests.
+
+Recorder sits under a client as a transport wrapper and appends one JSON
+line per call to a (gzip compressed, for a .gz path) file: the request body,
+the response status and the response body split into the chunks the client
+received, each with its time since the request was sent. Chunks are the bytes
+on the wire, so a compressed body stays compressed and its Content-Encoding
+is recorded with it:
+
+    recorder = Recorder("traffic.jsonl.gz")
+    client = DeepSeekClient(api_key=..., pool=recorder.pool())
+    ...
+    recorder.close()
+
+A recording can then be served back by a local endpoint, with the original
+chunk timings scaled by --speed, or re-sent through a DeepSeekClient at the
+original arrival times (scaled the same way) to measure the client itself.
+Authorization headers are never recorded.
+
+Usage:
+    python replay.py serve traffic.jsonl.gz --speed 10 --port 8089
+    python replay.py send traffic.jsonl.gz --speed 100
+    python replay.py send traffic.jsonl.gz --speed 1 --base-url http://127.0.0.1:8089
+"""
+
+import argparse
+import asyncio
+import collections
+import gzip
+import itertools
+import json
+import sys
+import threading
+import time
+
+from bench_throughput import percentile
+from fake_server import FakeDeepSeekServer
+from test import ConnectionPool, DeepSeekClient, DeepSeekError, cache_key, http_library
+
+# the recording transports wrap the SDK's own ones, so they share its HTTP library
+httpx = http_library()
+
+# content-encoding must travel with the body: chunks are recorded before decompression
+RECORDED_HEADERS = ("content-type", "content-encoding", "retry-after", "retry-after-ms")
+
+
+def open_recording(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def load_recordings(path):
+    """Read a recording, ordered by arrival time."""
+    with open_recording(path, "r") as f:
+        recordings = [json.loads(line) for line in f if line.strip()]
+    return sorted(recordings, key=lambda recording: recording["offset"])
+
+
+class Recorder:
+    """
+    Appends every call made through its transports to a JSONL recording.
+
+    Args:
+        path (str): File to append to; gzip compressed when it ends in ".gz".
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.started_at = time.perf_counter()
+        self._file = open_recording(path, "a")
+        self._lock = threading.Lock()
+
+    def pool(self, **pool_kwargs):
+        """A private ConnectionPool whose traffic is recorded."""
+        return ConnectionPool(transport_wrapper=self.wrap_transport, **pool_kwargs)
+
+    def wrap_transport(self, transport):
+        if isinstance(transport, httpx.AsyncBaseTransport):
+            return _AsyncRecordingTransport(self, transport)
+        return _RecordingTransport(self, transport)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def _entry(self, request, response, sent_at):
+        try:
+            body = json.loads(request.content)
+        except ValueError:
+            body = request.content.decode("utf-8", "replace")
+        return {
+            "offset": sent_at - self.started_at,
+            "method": request.method,
+            "path": request.url.path,
+            "request": body,
+            "status": response.status_code,
+            "headers": {name: response.headers[name] for name in RECORDED_HEADERS if name in response.headers},
+            "headers_at": time.perf_counter() - sent_at,
+            "chunks": []
+        }
+
+    def _write(self, entry):
+        if entry["chunks"] is None:
+            return
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line)
+
+
+class _RecordingStream(httpx.SyncByteStream):
+    def __init__(self, recorder, stream, entry, sent_at):
+        self.recorder = recorder
+        self.stream = stream
+        self.entry = entry
+        self.sent_at = sent_at
+
+    def __iter__(self):
+        for data in self.stream:
+            # latin-1 keeps the exact bytes even when a chunk splits a UTF-8 character
+            self.entry["chunks"].append([time.perf_counter() - self.sent_at, data.decode("latin-1")])
+            yield data
+
+    def close(self):
+        self.stream.close()
+        self.recorder._write(self.entry)
+        self.entry["chunks"] = None
+
+
+class _AsyncRecordingStream(httpx.AsyncByteStream):
+    def __init__(self, recorder, stream, entry, sent_at):
+        self.recorder = recorder
+        self.stream = stream
+        self.entry = entry
+        self.sent_at = sent_at
+
+    async def __aiter__(self):
+        async for data in self.stream:
+            self.entry["chunks"].append([time.perf_counter() - self.sent_at, data.decode("latin-1")])
+            yield data
+
+    async def aclose(self):
+        await self.stream.aclose()
+        self.recorder._write(self.entry)
+        self.entry["chunks"] = None
+
+
+class _RecordingTransport(httpx.BaseTransport):
+    def __init__(self, recorder, transport):
+        self.recorder = recorder
+        self.transport = transport
+
+    def handle_request(self, request):
+        sent_at = time.perf_counter()
+        response = self.transport.handle_request(request)
+        entry = self.recorder._entry(request, response, sent_at)
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=_RecordingStream(self.recorder, response.stream, entry, sent_at),
+            extensions=response.extensions
+        )
+
+    def close(self):
+        self.transport.close()
+
+
+class _AsyncRecordingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, recorder, transport):
+        self.recorder = recorder
+        self.transport = transport
+
+    async def handle_async_request(self, request):
+        sent_at = time.perf_counter()
+        response = await self.transport.handle_async_request(request)
+        entry = self.recorder._entry(request, response, sent_at)
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=_AsyncRecordingStream(self.recorder, response.stream, entry, sent_at),
+            extensions=response.extensions
+        )
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def request_key(body):
+    if not isinstance(body, dict):
+        return None
+    return cache_key(body.get("model"), body.get("messages", []), stream=bool(body.get("stream")))
+
+
+class ReplayServer(FakeDeepSeekServer):
+    """
+    Serves recorded responses with their recorded timings divided by `speed`.
+
+    A request is answered with a recording of the same model, messages and
+    stream flag when one exists (cycling through repeats), and otherwise with
+    the next recording in arrival order.
+
+    Args:
+        recordings (list): Entries from load_recordings.
+        speed (float, optional): Time compression factor. Defaults to 1.
+        host (str, optional): Interface to bind. Defaults to "127.0.0.1".
+        port (int, optional): Port to bind; 0 picks a free one. Defaults to 0.
+    """
+
+    def __init__(self, recordings, speed=1.0, host="127.0.0.1", port=0):
+        super().__init__(host=host, port=port)
+        self.speed = speed
+        self.by_request = collections.defaultdict(list)
+        for recording in recordings:
+            self.by_request[request_key(recording["request"])].append(recording)
+        self._matches = {key: itertools.cycle(matches) for key, matches in self.by_request.items()}
+        self._fallback = itertools.cycle(recordings)
+
+    async def _handle_request(self, method, path, body, writer):
+        try:
+            request = json.loads(body)
+        except ValueError:
+            request = None
+        key = request_key(request)
+        recording = next(self._matches[key]) if key in self._matches else next(self._fallback)
+        self.stats["requests"] += 1
+        if isinstance(request, dict) and request.get("stream"):
+            self.stats["streams"] += 1
+
+        sent_at = time.perf_counter()
+
+        async def wait_until(elapsed):
+            await asyncio.sleep(max(0.0, sent_at + elapsed / self.speed - time.perf_counter()))
+
+        headers = dict(recording["headers"], **{"Transfer-Encoding": "chunked"})
+        await wait_until(recording["headers_at"])
+        writer.write(self._status_head(recording["status"], headers))
+        for elapsed, text in recording["chunks"]:
+            await wait_until(elapsed)
+            data = text.encode("latin-1")
+            writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+async def resend(recordings, client, speed=1.0):
+    """
+    Re-issue recorded requests through `client` at their recorded arrival
+    times divided by `speed`, and summarise how the client kept up.
+    """
+    loop = asyncio.get_running_loop()
+    first = recordings[0]["offset"] if recordings else 0.0
+    latencies, ttfts, errors = [], [], 0
+
+    async def one(recording):
+        nonlocal errors
+        await asyncio.sleep(max(0.0, (recording["offset"] - first) / speed - (loop.time() - started)))
+        params = dict(recording["request"])
+        messages = params.pop("messages")
+        stream = params.pop("stream", False)
+        params.pop("stream_options", None)
+        sent_at = time.perf_counter()
+        try:
+            if stream:
+                first_chunk = None
+                async for _ in client.async_stream_response(messages, **params):
+                    if first_chunk is None:
+                        first_chunk = time.perf_counter() - sent_at
+                if first_chunk is not None:
+                    ttfts.append(first_chunk)
+            else:
+                await client.async_chat_completion(messages, **params)
+            latencies.append(time.perf_counter() - sent_at)
+        except DeepSeekError:
+            errors += 1
+
+    started = loop.time()
+    await asyncio.gather(*(one(recording) for recording in recordings if recording["method"] == "POST"))
+    elapsed = loop.time() - started
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "speed": speed,
+        "elapsed_s": elapsed,
+        "req_per_s": (len(latencies) + errors) / elapsed if elapsed else None,
+        "p50_ms": percentile(latencies, 50) * 1000 if latencies else None,
+        "p95_ms": percentile(latencies, 95) * 1000 if latencies else None,
+        "p99_ms": percentile(latencies, 99) * 1000 if latencies else None,
+        "ttft_p50_ms": percentile(ttfts, 50) * 1000 if ttfts else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve = commands.add_parser("serve", help="serve a recording from a local endpoint")
+    serve.add_argument("recording")
+    serve.add_argument("--speed", type=float, default=1.0)
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8089)
+    send = commands.add_parser("send", help="re-send a recording through DeepSeekClient")
+    send.add_argument("recording")
+    send.add_argument("--speed", type=float, default=1.0)
+    send.add_argument("--base-url", help="endpoint to send to; defaults to a local replay of the recording")
+    send.add_argument("--api-key", default="replay")
+    args = parser.parse_args()
+
+    recordings = load_recordings(args.recording)
+    if args.command == "serve":
+        server = ReplayServer(recordings, speed=args.speed, host=args.host, port=args.port)
+        print(f"Replaying {len(recordings)} calls at {args.speed:g}x on http://{args.host}:{args.port}")
+        try:
+            asyncio.run(server.serve_forever())
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    async def run(base_url):
+        client = DeepSeekClient(api_key=args.api_key, base_url=base_url, max_retries=0)
+        return await resend(recordings, client, speed=args.speed)
+
+    if args.base_url:
+        summary = asyncio.run(run(args.base_url))
+    else:
+        with ReplayServer(recordings, speed=args.speed) as server:
+            summary = asyncio.run(run(server.base_url))
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
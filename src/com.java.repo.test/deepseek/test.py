@@ -1,6 +1,43 @@
-from typing import Optional, Dict, List, Generator, AsyncGenerator
-from openai import OpenAI, AsyncOpenAI
-from openai.types.chat import ChatCompletion, ChatCompletionChunk
+"""
+DeepSeek client built on the OpenAI SDK.
+
+`openai` and its HTTP library are imported on first use rather than at import
+time, and each DeepSeekClient builds its sync and async SDK clients only when
+they are first needed, so importing this module stays cheap for CLI and
+serverless entry points. See bench_import.py for the startup budget.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import contextvars
+import functools
+import hashlib
+import importlib
+import inspect
+import itertools
+import json
+import logging
+import math
+import random
+import re
+import socket
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError, wait
+from typing import (
+    TYPE_CHECKING, Any, Callable, Optional, Dict, List, Tuple, Union, Iterable, Iterator, Generator, AsyncGenerator
+)
+
+if TYPE_CHECKING:
+    import sqlite3
+    # http_library() at runtime; the openai releases this targets are built on httpx2
+    import httpx2 as httpx
+    from openai import OpenAI, AsyncOpenAI
+    from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+logger = logging.getLogger(__name__)
 
 class DeepSeekError(Exception):
     """Base exception class for DeepSeek errors"""
@@ -10,25 +47,2570 @@ class DeepSeekAPIError(DeepSeekError):
     """Exception raised for API errors"""
     pass
 
+class DeepSeekRateLimitError(DeepSeekAPIError):
+    """Exception raised when requests are still rate limited after all retries"""
+    pass
+
+class DeepSeekContextError(DeepSeekError):
+    """Exception raised when a request cannot be made to fit the context window"""
+    pass
+
+class DeepSeekStreamOverrunError(DeepSeekError):
+    """Exception raised to a stream consumer that fell too far behind and was disconnected"""
+    pass
+
+def _field(value: Any, name: str) -> Any:
+    """Read `name` from an SDK model or from the equivalent decoded JSON dict."""
+    if isinstance(value, dict):
+        return value.get(name)
+    return getattr(value, name, None)
+
+# create() keyword arguments that are request options rather than body fields
+_REQUEST_OPTIONS = {"extra_headers": "headers", "extra_query": "params", "extra_body": "extra_json", "timeout": "timeout"}
+
+def _post_args(params: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Split chat.completions.create() arguments into a request body and SDK request options."""
+    body, options = {}, {}
+    for name, value in params.items():
+        if name in _REQUEST_OPTIONS:
+            options[_REQUEST_OPTIONS[name]] = value
+        else:
+            body[name] = value
+    return body, options
+
+class CallMetrics:
+    """
+    Timings and token usage of one DeepSeekClient call, handed to observers.
+
+    All durations are in seconds. `connect_time` is 0 when a pooled connection
+    was reused and None when it could not be measured.
+    """
+
+    __slots__ = (
+        "model", "stream", "cached", "error", "queue_wait", "connect_time",
+        "time_to_first_byte", "latency", "prompt_tokens", "completion_tokens",
+        "prompt_cache_hit_tokens", "_started_at", "_sent_at", "_connect_started_at", "_reservation"
+    )
+
+    def __init__(self, model: str, stream: bool = False):
+        self.model = model
+        self.stream = stream
+        self.cached = False
+        self.error: Optional[BaseException] = None
+        self.queue_wait = 0.0
+        self.connect_time: Optional[float] = None
+        self.time_to_first_byte: Optional[float] = None
+        self.latency: Optional[float] = None
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+        self.prompt_cache_hit_tokens: Optional[int] = None
+        self._started_at = time.perf_counter()
+        self._sent_at = self._started_at
+        self._connect_started_at: Optional[float] = None
+        # (reserved, prompt, limiters) of a stream, settled by its reader on close
+        self._reservation: Optional[Tuple[int, int, List[RateLimiter]]] = None
+
+    def record_usage(self, usage) -> None:
+        if usage is None:
+            return
+        self.prompt_tokens = _field(usage, "prompt_tokens")
+        self.completion_tokens = _field(usage, "completion_tokens")
+        self.prompt_cache_hit_tokens = _field(usage, "prompt_cache_hit_tokens")
+
+    def _mark_sent(self) -> None:
+        self._sent_at = time.perf_counter()
+        self.connect_time = 0.0
+
+    def _trace(self, name: str, info: Dict) -> None:
+        now = time.perf_counter()
+        if name == "connection.connect_tcp.started":
+            self._connect_started_at = now
+        elif name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+            if self._connect_started_at is not None:
+                self.connect_time = now - self._connect_started_at
+        elif name.endswith(".receive_response_headers.complete"):
+            self.time_to_first_byte = now - self._sent_at
+
+    async def _atrace(self, name: str, info: Dict) -> None:
+        self._trace(name, info)
+
+_current_call: contextvars.ContextVar = contextvars.ContextVar("deepseek_current_call", default=None)
+
+def _trace_request(request: httpx.Request) -> None:
+    call = _current_call.get()
+    if call is not None:
+        request.extensions["trace"] = call._trace
+
+async def _atrace_request(request: httpx.Request) -> None:
+    call = _current_call.get()
+    if call is not None:
+        request.extensions["trace"] = call._atrace
+
+class Observer:
+    """
+    Receives a CallMetrics after every DeepSeekClient call completes or fails.
+    Subclasses override the hooks they need; the base ones do nothing.
+    """
+
+    def on_call(self, call: CallMetrics) -> None:
+        """Called once per call, including cached and failed ones."""
+
+class HistogramAggregator(Observer):
+    """
+    In-process aggregation of CallMetrics into per-model histograms and
+    counters, exportable in the Prometheus text exposition format.
+
+    Args:
+        buckets (tuple, optional): Upper bounds, in seconds, of the histogram buckets.
+    """
+
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+    TIMINGS = ("queue_wait", "connect_time", "time_to_first_byte", "latency")
+    TOKENS = ("prompt_tokens", "completion_tokens", "prompt_cache_hit_tokens")
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._histograms: Dict[Tuple[str, str], List] = {}
+        self._counters: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def on_call(self, call: CallMetrics) -> None:
+        with self._lock:
+            self._count("requests", call.model)
+            if call.error is not None:
+                self._count("errors", call.model)
+            if call.cached:
+                self._count("cache_hits", call.model)
+            for name in self.TOKENS:
+                value = getattr(call, name)
+                if value:
+                    self._count(name, call.model, value)
+            for name in self.TIMINGS:
+                value = getattr(call, name)
+                if value is not None:
+                    self._observe(name, call.model, value)
+
+    def _count(self, name: str, model: str, amount: int = 1) -> None:
+        self._counters[(name, model)] = self._counters.get((name, model), 0) + amount
+
+    def _observe(self, name: str, model: str, value: float) -> None:
+        histogram = self._histograms.get((name, model))
+        if histogram is None:
+            histogram = self._histograms[(name, model)] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                histogram[0][i] += 1
+                break
+        histogram[1] += value
+        histogram[2] += 1
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Copy of the counters and histograms, keyed by `name` then model."""
+        with self._lock:
+            counters: Dict[str, Dict] = {}
+            for (name, model), value in self._counters.items():
+                counters.setdefault(name, {})[model] = value
+            histograms: Dict[str, Dict] = {}
+            for (name, model), (counts, total, count) in self._histograms.items():
+                histograms.setdefault(name, {})[model] = {
+                    "buckets": dict(zip(self.buckets, counts)), "sum": total, "count": count
+                }
+        return {"counters": counters, "histograms": histograms}
+
+    def prometheus_text(self, prefix: str = "deepseek") -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+        for name, by_model in sorted(snapshot["counters"].items()):
+            metric = f"{prefix}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for model, value in sorted(by_model.items()):
+                lines.append(f'{metric}{{model="{_escape_label(model)}"}} {value}')
+        for name, by_model in sorted(snapshot["histograms"].items()):
+            metric = f"{prefix}_{name}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            for model, histogram in sorted(by_model.items()):
+                label = f'model="{_escape_label(model)}"'
+                cumulative = 0
+                for bound, count in histogram["buckets"].items():
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{{label},le="+Inf"}} {histogram["count"]}')
+                lines.append(f"{metric}_sum{{{label}}} {histogram['sum']}")
+                lines.append(f"{metric}_count{{{label}}} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+@functools.lru_cache(maxsize=None)
+def http_library():
+    """
+    The httpx-compatible module the installed `openai` SDK is built on: `httpx`,
+    or `httpx2` in newer SDK releases. Transports, limits and responses handed to
+    the SDK must come from this module rather than from a separately imported one.
+    """
+    from openai import DefaultHttpxClient
+    for cls in DefaultHttpxClient.__mro__:
+        package = cls.__module__.partition(".")[0]
+        if package != "openai" and hasattr(importlib.import_module(package), "Client"):
+            return importlib.import_module(package)
+    raise ImportError("cannot find the HTTP library used by the openai SDK")
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+class ConnectionPool:
+    """
+    A keep-alive HTTP connection pool shared by every DeepSeekClient that talks
+    to the same endpoint with the same key.
+
+    The sync and async httpx clients are created on first use. httpx connections
+    cannot move between event loops, so each running loop gets its own async
+    client, dropped once that loop is closed.
+
+    Args:
+        max_connections (int, optional): Upper bound on open connections. Defaults to 100.
+        max_keepalive_connections (int, optional): Idle connections kept open. Defaults to 20.
+        keepalive_expiry (float, optional): Seconds an idle connection is kept. Defaults to 30.0.
+        http2 (bool, optional): Multiplex requests over HTTP/2 when the `h2` package
+            is installed. Defaults to True.
+        transport_wrapper (callable, optional): Called with each new httpx transport,
+            sync or async, and returns the transport to use instead. Defaults to None.
+    """
+
+    def __init__(
+            self,
+            max_connections: int = 100,
+            max_keepalive_connections: int = 20,
+            keepalive_expiry: float = 30.0,
+            http2: bool = True,
+            transport_wrapper: Optional[Callable[[Any], Any]] = None
+    ):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2 and _http2_available()
+        self.transport_wrapper = transport_wrapper
+        self._sync_client: Optional[httpx.Client] = None
+        self._async_clients: Dict[Any, httpx.AsyncClient] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def limits(self) -> httpx.Limits:
+        return http_library().Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry
+        )
+
+    @property
+    def sync_client(self) -> httpx.Client:
+        with self._lock:
+            if self._sync_client is None or self._sync_client.is_closed:
+                from openai import DefaultHttpxClient
+                self._sync_client = DefaultHttpxClient(
+                    limits=self.limits, http2=self.http2, event_hooks={"request": [_trace_request]},
+                    **self._transport(sync=True)
+                )
+            return self._sync_client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        """The async client for the running event loop (or for no loop)."""
+        loop = _running_loop()
+        with self._lock:
+            client = self._async_clients.get(loop)
+            if client is None or client.is_closed:
+                _forget_closed_loops(self._async_clients)
+                from openai import DefaultAsyncHttpxClient
+                client = self._async_clients[loop] = DefaultAsyncHttpxClient(
+                    limits=self.limits, http2=self.http2, event_hooks={"request": [_atrace_request]},
+                    **self._transport(sync=False)
+                )
+            return client
+
+    def _transport(self, sync: bool) -> Dict[str, Any]:
+        if self.transport_wrapper is None:
+            return {}
+        http = http_library()
+        transport_class = http.HTTPTransport if sync else http.AsyncHTTPTransport
+        return {"transport": self.transport_wrapper(transport_class(limits=self.limits, http2=self.http2))}
+
+    def close(self) -> None:
+        """
+        Close the sync client and drop the async ones without awaiting them.
+
+        DeepSeekClients already built on this pool must not be used afterwards.
+        """
+        with self._lock:
+            sync_client, self._sync_client = self._sync_client, None
+            self._async_clients.clear()
+        if sync_client is not None:
+            sync_client.close()
+
+    async def aclose(self) -> None:
+        """Close the sync client and the running loop's async client; drop the rest."""
+        with self._lock:
+            sync_client, self._sync_client = self._sync_client, None
+            async_client = self._async_clients.get(_running_loop())
+            self._async_clients.clear()
+        if sync_client is not None:
+            sync_client.close()
+        if async_client is not None:
+            await async_client.aclose()
+
+_NO_LOOP = None
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return _NO_LOOP
+
+def _forget_closed_loops(by_loop: Dict) -> None:
+    for loop in [loop for loop in by_loop if loop is not _NO_LOOP and loop.is_closed()]:
+        del by_loop[loop]
+
+_pools: Dict[Tuple[str, str], ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+def get_connection_pool(api_key: str, base_url: str = "https://api.deepseek.com", **pool_kwargs) -> ConnectionPool:
+    """
+    Return the process-wide pool for `(base_url, api_key)`, creating it on first use.
+
+    `pool_kwargs` are passed to ConnectionPool and only take effect when the pool
+    is created.
+    """
+    key = (base_url.rstrip("/"), api_key)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(**pool_kwargs)
+        return pool
+
+def close_connection_pools() -> None:
+    """Close and forget every process-wide pool."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+async def aclose_connection_pools() -> None:
+    """Close and forget every process-wide pool, awaiting the async clients."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        await pool.aclose()
+
+def cache_key(model: str, messages: List[Dict[str, str]], **kwargs) -> str:
+    """Return a canonical hash of a chat completion request."""
+    payload = json.dumps(
+        {"model": model, "messages": messages, "kwargs": kwargs},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def is_deterministic(temperature: float, stream: bool = False, **kwargs) -> bool:
+    """Whether a request may be answered from a cache."""
+    return not stream and (temperature == 0 or kwargs.get("seed") is not None)
+
+class ResponseCache:
+    """
+    A two-tier cache of ChatCompletion responses: an in-memory LRU and an
+    optional SQLite file that survives restarts.
+
+    Args:
+        ttl (float, optional): Seconds an entry stays valid. None keeps entries forever.
+            Defaults to 3600.
+        max_entries (int, optional): Entries kept in memory. Defaults to 1024.
+        max_bytes (int, optional): Serialized bytes kept in memory. Defaults to 64 MiB.
+        path (str, optional): SQLite database file for the disk tier. Defaults to None.
+        disk_max_entries (int, optional): Rows kept on disk; the oldest are deleted
+            first. None means no limit. Defaults to 100000.
+        disk_max_bytes (int, optional): Serialized bytes kept on disk. None means no
+            limit. Defaults to 1 GiB.
+    """
+
+    PRUNE_INTERVAL = 64
+
+    def __init__(
+            self,
+            ttl: Optional[float] = 3600,
+            max_entries: int = 1024,
+            max_bytes: int = 64 * 1024 * 1024,
+            path: Optional[str] = None,
+            disk_max_entries: Optional[int] = 100_000,
+            disk_max_bytes: Optional[int] = 1024 * 1024 * 1024
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_max_entries = disk_max_entries
+        self.disk_max_bytes = disk_max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[bytes, Optional[float]]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._sets_since_prune = 0
+        if path is not None:
+            import sqlite3
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)"
+            )
+            self._db.commit()
+            self.prune()
+
+    def get(self, key: str, raw: bool = False) -> Union[ChatCompletion, Dict[str, Any], None]:
+        """The cached response, as a ChatCompletion or, with `raw`, the decoded JSON dict."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= now:
+                self._discard(key)
+                entry = None
+            if entry is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and (row[1] is None or row[1] > now):
+                    entry = (row[0], row[1])
+                    self._store(key, entry)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        if raw:
+            return json.loads(entry[0])
+        from openai.types.chat import ChatCompletion
+        return ChatCompletion.model_validate_json(entry[0])
+
+    def set(self, key: str, response: Union[ChatCompletion, Dict[str, Any]]) -> None:
+        if isinstance(response, dict):
+            value = json.dumps(response, separators=(",", ":")).encode("utf-8")
+        else:
+            value = response.model_dump_json().encode("utf-8")
+        expires = time.time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._store(key, (value, expires))
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, expires) VALUES (?, ?, ?)",
+                    (key, value, expires)
+                )
+                self._db.commit()
+                self._sets_since_prune += 1
+                if self._sets_since_prune >= self.PRUNE_INTERVAL:
+                    self._prune()
+
+    def prune(self) -> None:
+        """
+        Delete expired rows from the disk tier, then the oldest rows until it is
+        within `disk_max_entries` and `disk_max_bytes`. Runs every PRUNE_INTERVAL
+        sets; SQLite reuses the freed pages, so the file stops growing.
+        """
+        with self._lock:
+            if self._db is not None:
+                self._prune()
+
+    def _prune(self) -> None:
+        self._sets_since_prune = 0
+        db = self._db
+        db.execute("DELETE FROM responses WHERE expires IS NOT NULL AND expires <= ?", (time.time(),))
+        count, size = db.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM responses").fetchone()
+        # INSERT OR REPLACE gives a rewritten key a new rowid, so rowid order is write order
+        excess_rows = count - self.disk_max_entries if self.disk_max_entries is not None else 0
+        excess_bytes = size - self.disk_max_bytes if self.disk_max_bytes is not None else 0
+        cutoff = None
+        for rowid, length in db.execute("SELECT rowid, LENGTH(value) FROM responses ORDER BY rowid"):
+            if excess_rows <= 0 and excess_bytes <= 0:
+                break
+            cutoff = rowid
+            excess_rows -= 1
+            excess_bytes -= length
+        if cutoff is not None:
+            db.execute("DELETE FROM responses WHERE rowid <= ?", (cutoff,))
+        db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _store(self, key: str, entry: Tuple[bytes, Optional[float]]) -> None:
+        self._discard(key)
+        if len(entry[0]) > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self._bytes += len(entry[0])
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (value, _) = self._entries.popitem(last=False)
+            self._bytes -= len(value)
+
+    def _discard(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+
+class CompletionResult:
+    """
+    The parts of a chat completion most callers read, taken straight from the
+    decoded JSON without building the SDK's pydantic models. `tool_calls` and
+    `usage` are the API's plain dicts.
+    """
+
+    __slots__ = ("content", "finish_reason", "tool_calls", "usage")
+
+    def __init__(
+            self,
+            content: Optional[str],
+            finish_reason: Optional[str],
+            tool_calls: Optional[List[Dict[str, Any]]],
+            usage: Optional[Dict[str, Any]]
+    ):
+        self.content = content
+        self.finish_reason = finish_reason
+        self.tool_calls = tool_calls
+        self.usage = usage
+
+    @classmethod
+    def from_dict(cls, body: Dict[str, Any]) -> CompletionResult:
+        choice = body["choices"][0]
+        message = choice.get("message") or {}
+        return cls(message.get("content"), choice.get("finish_reason"), message.get("tool_calls"), body.get("usage"))
+
+    def __repr__(self) -> str:
+        return f"CompletionResult(content={self.content!r}, finish_reason={self.finish_reason!r})"
+
+RESULT_TYPES = ("completion", "result", "dict")
+
+class StreamDelta:
+    """
+    One streamed chunk reduced to `choices[0]`: the delta's fields as plain
+    values (`tool_calls` and `usage` are the API's dicts) and the finish reason.
+    """
+
+    __slots__ = ("content", "reasoning_content", "tool_calls", "finish_reason", "usage", "model")
+
+    def __init__(self, content, reasoning_content, tool_calls, finish_reason, usage, model):
+        self.content = content
+        self.reasoning_content = reasoning_content
+        self.tool_calls = tool_calls
+        self.finish_reason = finish_reason
+        self.usage = usage
+        self.model = model
+
+    def __repr__(self) -> str:
+        return f"StreamDelta(content={self.content!r}, finish_reason={self.finish_reason!r})"
+
+class SSEDeltaDecoder:
+    """
+    Decodes the chat-completions SSE byte stream into StreamDeltas without the
+    SDK's per-chunk pydantic models.
+
+    Incoming bytes are appended to one buffer and frames are located in place
+    through a memoryview; the only copy is each `data:` payload handed to
+    json.loads. `done` is set once `data: [DONE]` arrives.
+    """
+
+    def __init__(self):
+        self.done = False
+        self._buffer = bytearray()
+        self._carriage_return = False
+
+    def feed(self, data: bytes) -> List[StreamDelta]:
+        buffer = self._buffer
+        if self._carriage_return:
+            data = b"\r" + data
+            self._carriage_return = False
+        if b"\r" in data:
+            # Hold back a trailing CR in case its LF arrives with the next read
+            if data.endswith(b"\r"):
+                data = data[:-1]
+                self._carriage_return = True
+            data = data.replace(b"\r\n", b"\n")
+        buffer += data
+        deltas: List[StreamDelta] = []
+        start = 0
+        view = memoryview(buffer)
+        try:
+            while not self.done:
+                end = buffer.find(b"\n\n", start)
+                if end < 0:
+                    break
+                self._frame(view, start, end, deltas)
+                start = end + 2
+        finally:
+            view.release()
+        del buffer[:start]
+        return deltas
+
+    def _frame(self, view: memoryview, start: int, end: int, deltas: List[StreamDelta]) -> None:
+        buffer = self._buffer
+        lines = []
+        while start < end:
+            line_end = buffer.find(b"\n", start, end)
+            if line_end < 0:
+                line_end = end
+            if buffer.startswith(b"data:", start, line_end):
+                value_start = start + 5
+                if value_start < line_end and buffer[value_start] == 0x20:
+                    value_start += 1
+                lines.append(view[value_start:line_end])
+            start = line_end + 1
+        if not lines:
+            return
+        payload = bytes(lines[0]) if len(lines) == 1 else b"\n".join(lines)
+        if payload == b"[DONE]":
+            self.done = True
+            return
+        body = json.loads(payload)
+        if body.get("error"):
+            raise DeepSeekAPIError(f"API Error: {body['error']}")
+        choices = body.get("choices")
+        if choices:
+            choice = choices[0]
+            delta = choice.get("delta") or {}
+            deltas.append(StreamDelta(
+                delta.get("content"), delta.get("reasoning_content"), delta.get("tool_calls"),
+                choice.get("finish_reason"), body.get("usage"), body.get("model")
+            ))
+        else:
+            deltas.append(StreamDelta(None, None, None, None, body.get("usage"), body.get("model")))
+
+def _iter_deltas(response: httpx.Response) -> Iterator[StreamDelta]:
+    decoder = SSEDeltaDecoder()
+    for data in response.iter_bytes():
+        yield from decoder.feed(data)
+        if decoder.done:
+            return
+
+async def _aiter_deltas(response: httpx.Response) -> AsyncGenerator[StreamDelta, None]:
+    decoder = SSEDeltaDecoder()
+    async for data in response.aiter_bytes():
+        for delta in decoder.feed(data):
+            yield delta
+        if decoder.done:
+            return
+
+class StreamAssembler:
+    """
+    Incrementally rebuilds the final message of a streamed chat completion and
+    times the stream.
+
+    Content is collected as a list of fragments and joined once, so assembly is
+    linear in the output length. Tool-call deltas are merged by their `index`.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.last_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.inter_token_latencies: List[float] = []
+        self.finish_reason: Optional[str] = None
+        self.usage = None
+        self.model: Optional[str] = None
+        self._content: List[str] = []
+        self._reasoning: List[str] = []
+        self._tool_calls: Dict[int, Dict[str, Any]] = {}
+
+    def start(self) -> None:
+        """Reset the clock; call right before the request is sent."""
+        self.started_at = time.perf_counter()
+
+    def add(self, chunk: Union[ChatCompletionChunk, StreamDelta]) -> None:
+        now = time.perf_counter()
+        self.model = self.model or chunk.model
+        if chunk.usage is not None:
+            self.usage = chunk.usage
+        if isinstance(chunk, StreamDelta):
+            delta = chunk
+            finish_reason = chunk.finish_reason
+        elif chunk.choices:
+            delta = chunk.choices[0].delta
+            finish_reason = chunk.choices[0].finish_reason
+        else:
+            return
+        if finish_reason is not None:
+            self.finish_reason = finish_reason
+        produced = False
+        if delta.content:
+            self._content.append(delta.content)
+            produced = True
+        reasoning = getattr(delta, "reasoning_content", None)
+        if reasoning:
+            self._reasoning.append(reasoning)
+            produced = True
+        # Tool-call deltas are SDK models, or plain dicts from a StreamDelta
+        for tool_call in delta.tool_calls or ():
+            entry = self._tool_calls.setdefault(
+                _field(tool_call, "index"), {"id": None, "type": "function", "name": None, "arguments": []}
+            )
+            if _field(tool_call, "id"):
+                entry["id"] = _field(tool_call, "id")
+            if _field(tool_call, "type"):
+                entry["type"] = _field(tool_call, "type")
+            function = _field(tool_call, "function")
+            if function is not None:
+                if _field(function, "name"):
+                    entry["name"] = _field(function, "name")
+                if _field(function, "arguments"):
+                    entry["arguments"].append(_field(function, "arguments"))
+            produced = True
+        if produced:
+            if self.first_token_at is None:
+                self.first_token_at = now
+            else:
+                self.inter_token_latencies.append(now - self.last_token_at)
+            self.last_token_at = now
+
+    def finish(self) -> None:
+        self.finished_at = time.perf_counter()
+
+    @property
+    def content(self) -> str:
+        if len(self._content) > 1:
+            self._content[:] = ["".join(self._content)]
+        return self._content[0] if self._content else ""
+
+    @property
+    def reasoning_content(self) -> str:
+        if len(self._reasoning) > 1:
+            self._reasoning[:] = ["".join(self._reasoning)]
+        return self._reasoning[0] if self._reasoning else ""
+
+    @property
+    def tool_calls(self) -> List[Dict[str, Any]]:
+        """Completed tool calls in the `tools=` message format."""
+        return [
+            {
+                "id": entry["id"],
+                "type": entry["type"],
+                "function": {"name": entry["name"], "arguments": "".join(entry["arguments"])}
+            }
+            for _, entry in sorted(self._tool_calls.items())
+        ]
+
+    def message(self) -> Dict[str, Any]:
+        """The assembled assistant message, ready to append to a conversation."""
+        message: Dict[str, Any] = {"role": "assistant", "content": self.content}
+        tool_calls = self.tool_calls
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+        return message
+
+    @property
+    def metrics(self) -> Dict[str, Optional[float]]:
+        """Time to first token, inter-token latency and total duration, in seconds."""
+        latencies = self.inter_token_latencies
+        end = self.finished_at if self.finished_at is not None else self.last_token_at
+        return {
+            "time_to_first_token": None if self.first_token_at is None else self.first_token_at - self.started_at,
+            "mean_inter_token_latency": sum(latencies) / len(latencies) if latencies else None,
+            "max_inter_token_latency": max(latencies) if latencies else None,
+            "total_duration": None if end is None else end - self.started_at
+        }
+
+_JSON_WHITESPACE = " \t\n\r"
+_JSON_SCALAR_END = ",]} \t\n\r"
+_JSON_STRING_SPECIAL = re.compile(r'["\\]')
+
+class JSONStreamParser:
+    """
+    Push parser for one JSON document arriving in fragments, e.g. the content
+    of a `response_format={"type": "json_object"}` stream.
+
+    feed() returns `(path, value)` for every value completed by the new text:
+    object fields and array elements as soon as they close, and finally the
+    whole document with path `()`. A path is the tuple of keys and indices
+    leading to the value, so `("items", 0)` is the first element of "items".
+
+    Args:
+        max_depth (int, optional): Only report values at most this many levels
+            deep (the document itself is always reported). Defaults to None.
+    """
+
+    def __init__(self, max_depth: Optional[int] = None):
+        self.max_depth = max_depth
+        self.done = False
+        self.value: Any = None
+        # One [container, key, state] frame per open object or array
+        self._stack: List[list] = []
+        self._kind: Optional[str] = None
+        self._raw: List[str] = []
+        self._escaped = False
+        self._events: List[Tuple[tuple, Any]] = []
+
+    def feed(self, text: str) -> List[Tuple[tuple, Any]]:
+        i, n = 0, len(text)
+        while i < n:
+            if self._kind == "scalar":
+                j = i
+                while j < n and text[j] not in _JSON_SCALAR_END:
+                    j += 1
+                self._raw.append(text[i:j])
+                if j == n:
+                    break
+                self._end_scalar()
+                i = j
+            elif self._kind is not None:
+                i = self._read_string(text, i)
+            else:
+                ch = text[i]
+                i += 1
+                if ch not in _JSON_WHITESPACE:
+                    self._token(ch)
+        events, self._events = self._events, []
+        return events
+
+    def close(self) -> List[Tuple[tuple, Any]]:
+        """Finish the document; raises ValueError if it is incomplete."""
+        if self._kind == "scalar" and not self._stack:
+            self._end_scalar()
+        if not self.done:
+            raise ValueError("JSON document is incomplete")
+        events, self._events = self._events, []
+        return events
+
+    def _token(self, ch: str) -> None:
+        if self.done:
+            raise ValueError(f"Unexpected {ch!r} after the JSON document")
+        frame = self._stack[-1] if self._stack else None
+        state = frame[2] if frame else "value"
+        if state in ("key", "key_or_end"):
+            if ch == '"':
+                self._kind = "key"
+                return
+            if ch == "}" and state == "key_or_end":
+                self._close()
+                return
+        elif state == "colon":
+            if ch == ":":
+                frame[2] = "value"
+                return
+        elif state == "next":
+            if ch == ",":
+                frame[2] = "key" if isinstance(frame[0], dict) else "value"
+                return
+            if ch == ("}" if isinstance(frame[0], dict) else "]"):
+                self._close()
+                return
+        else:
+            if ch == "]" and state == "value_or_end":
+                self._close()
+                return
+            if ch == "{":
+                self._stack.append([{}, None, "key_or_end"])
+                return
+            if ch == "[":
+                self._stack.append([[], None, "value_or_end"])
+                return
+            if ch == '"':
+                self._kind = "string"
+                return
+            if ch in "-0123456789tfn":
+                self._kind = "scalar"
+                self._raw.append(ch)
+                return
+        raise ValueError(f"Unexpected {ch!r} in JSON stream")
+
+    def _read_string(self, text: str, i: int) -> int:
+        j, n = i, len(text)
+        while True:
+            if self._escaped:
+                if j >= n:
+                    break
+                self._escaped = False
+                j += 1
+                continue
+            match = _JSON_STRING_SPECIAL.search(text, j)
+            if match is None:
+                break
+            j = match.start()
+            if text[j] == "\\":
+                self._escaped = True
+                j += 1
+                continue
+            self._raw.append(text[i:j])
+            self._end_string()
+            return j + 1
+        self._raw.append(text[i:])
+        return n
+
+    def _end_string(self) -> None:
+        value = json.loads('"' + "".join(self._raw) + '"')
+        kind, self._kind, self._raw = self._kind, None, []
+        if kind == "key":
+            frame = self._stack[-1]
+            frame[1] = value
+            frame[2] = "colon"
+        else:
+            self._complete(value)
+
+    def _end_scalar(self) -> None:
+        value = json.loads("".join(self._raw))
+        self._kind, self._raw = None, []
+        self._complete(value)
+
+    def _close(self) -> None:
+        self._complete(self._stack.pop()[0])
+
+    def _complete(self, value: Any) -> None:
+        if not self._stack:
+            self.done = True
+            self.value = value
+            self._events.append(((), value))
+            return
+        frame = self._stack[-1]
+        container = frame[0]
+        if isinstance(container, dict):
+            key = frame[1]
+            container[key] = value
+        else:
+            key = len(container)
+            container.append(value)
+        frame[2] = "next"
+        if self.max_depth is None or len(self._stack) <= self.max_depth:
+            # Open ancestors are keyed by their pending key, or by the index their child will take
+            path = tuple(
+                parent[1] if isinstance(parent[0], dict) else len(parent[0]) for parent in self._stack[:-1]
+            )
+            self._events.append((path + (key,), value))
+
+def estimate_tokens(messages: List[Dict[str, str]], max_tokens: Optional[int] = None) -> int:
+    """Cheap upper-bound guess of the tokens a request will consume."""
+    prompt = sum(len(str(message.get("content") or "")) // 4 + 4 for message in messages)
+    return prompt + (max_tokens or 0)
+
+_tokenizers: Dict[str, Any] = {}
+_tokenizers_lock = threading.Lock()
+
+def load_tokenizer(path: str):
+    """
+    Load (once per process) a Hugging Face `tokenizer.json`, such as the one
+    published with the DeepSeek models. Requires the `tokenizers` package.
+    """
+    with _tokenizers_lock:
+        tokenizer = _tokenizers.get(path)
+        if tokenizer is None:
+            from tokenizers import Tokenizer
+            tokenizer = _tokenizers[path] = Tokenizer.from_file(path)
+        return tokenizer
+
+class TokenCounter:
+    """
+    Counts tokens locally, memoizing the count of each distinct text.
+
+    With a `tokenizer_path` the real tokenizer is used. Otherwise the count is
+    DeepSeek's published rule of thumb: about 0.3 tokens per ASCII character
+    and 0.6 per other character.
+
+    Args:
+        tokenizer_path (str, optional): Path to a `tokenizer.json`. Defaults to None.
+        cache_size (int, optional): Distinct texts whose counts are memoized. Defaults to 4096.
+        per_message (int, optional): Formatting tokens added per message. Defaults to 4.
+    """
+
+    def __init__(self, tokenizer_path: Optional[str] = None, cache_size: int = 4096, per_message: int = 4):
+        self.tokenizer = load_tokenizer(tokenizer_path) if tokenizer_path else None
+        self.per_message = per_message
+        self.count = functools.lru_cache(maxsize=cache_size)(self._count)
+
+    def _count(self, text: str) -> int:
+        if self.tokenizer is not None:
+            return len(self.tokenizer.encode(text, add_special_tokens=False).ids)
+        ascii_chars = sum(1 for ch in text if ch < "\x80")
+        return math.ceil(0.3 * ascii_chars + 0.6 * (len(text) - ascii_chars))
+
+    def count_message(self, message: Dict[str, Any]) -> int:
+        tokens = self.per_message + self.count(str(message.get("content") or ""))
+        for tool_call in message.get("tool_calls") or ():
+            function = tool_call.get("function", {})
+            tokens += self.count(function.get("name", "")) + self.count(function.get("arguments", ""))
+        return tokens
+
+    def count_messages(self, messages: List[Dict[str, Any]]) -> int:
+        return sum(self.count_message(message) for message in messages)
+
+class ContextPreflight:
+    """
+    Makes a request fit its model's context window before it is sent.
+
+    The oldest turns are dropped first; system messages and the final message
+    are always kept, and an assistant tool call is dropped or kept together
+    with its tool results, so a final tool result keeps the call it answers.
+    If the kept messages are still too long, the final message is truncated
+    from the front. A `max_tokens` larger than the room left is clamped to it;
+    without one the model's default output length applies, and `max_tokens`
+    is only set when that default would not fit.
+
+    Args:
+        counter (TokenCounter, optional): Token counter. Defaults to the heuristic counter.
+        context_windows (dict, optional): Context length per model, merged over
+            CONTEXT_WINDOWS.
+        max_output_tokens (dict, optional): Largest `max_tokens` per model, merged
+            over MAX_OUTPUT_TOKENS.
+        default_output_tokens (dict, optional): Output length per model when the
+            request has no `max_tokens`, merged over DEFAULT_OUTPUT_TOKENS.
+        min_output_tokens (int, optional): Output room kept free when trimming history
+            for a request without `max_tokens`. Defaults to 1024.
+    """
+
+    CONTEXT_WINDOWS = {"deepseek-chat": 131072, "deepseek-reasoner": 131072}
+    MAX_OUTPUT_TOKENS = {"deepseek-chat": 8192, "deepseek-reasoner": 65536}
+    DEFAULT_OUTPUT_TOKENS = {"deepseek-chat": 4096, "deepseek-reasoner": 32768}
+
+    def __init__(
+            self,
+            counter: Optional[TokenCounter] = None,
+            context_windows: Optional[Dict[str, int]] = None,
+            max_output_tokens: Optional[Dict[str, int]] = None,
+            min_output_tokens: int = 1024,
+            default_output_tokens: Optional[Dict[str, int]] = None
+    ):
+        self.counter = counter or TokenCounter()
+        self.context_windows = dict(self.CONTEXT_WINDOWS, **(context_windows or {}))
+        self.max_output_tokens = dict(self.MAX_OUTPUT_TOKENS, **(max_output_tokens or {}))
+        self.min_output_tokens = min_output_tokens
+        self.default_output_tokens = dict(self.DEFAULT_OUTPUT_TOKENS, **(default_output_tokens or {}))
+
+    def apply(
+            self,
+            model: str,
+            messages: List[Dict[str, Any]],
+            max_tokens: Optional[int] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Return the messages and max_tokens to send for `model`."""
+        window = self.context_windows.get(model)
+        if window is None:
+            return messages, max_tokens
+        output_cap = self.max_output_tokens.get(model, window)
+        reserve = min(max_tokens or self.min_output_tokens, output_cap)
+        budget = window - reserve
+        counts = [self.counter.count_message(message) for message in messages]
+        total = sum(counts)
+        if total > budget:
+            messages, total = self._drop_oldest(messages, counts, budget)
+        if total > budget:
+            messages, total = self._truncate_last(messages, total, budget)
+        room = min(window - total, output_cap)
+        if room <= 0:
+            raise DeepSeekContextError(f"Request needs {total} tokens; {model} allows {window}")
+        if max_tokens is None:
+            default = self.default_output_tokens.get(model, output_cap)
+            return messages, None if default <= room else room
+        return messages, min(max_tokens, room)
+
+    def count(self, messages: List[Dict[str, Any]]) -> int:
+        """Prompt tokens of `messages`, as counted by apply."""
+        return sum(self.counter.count_message(message) for message in messages)
+
+    def _drop_oldest(self, messages, counts, budget):
+        keep = [True] * len(messages)
+        total = sum(counts)
+        # A final tool result is kept with the tool call it answers, and that call's other results
+        protected = len(messages) - 1
+        while protected > 0 and messages[protected].get("role") == "tool":
+            protected -= 1
+        if not messages[protected].get("tool_calls"):
+            protected = len(messages) - 1
+        i = 0
+        while total > budget and i < protected:
+            if keep[i] and messages[i].get("role") != "system":
+                keep[i] = False
+                total -= counts[i]
+                j = i + 1
+                while messages[i].get("tool_calls") and j < protected and messages[j].get("role") == "tool":
+                    keep[j] = False
+                    total -= counts[j]
+                    j += 1
+            i += 1
+        return [message for message, kept in zip(messages, keep) if kept], total
+
+    def _truncate_last(self, messages, total, budget):
+        last = messages[-1]
+        content = str(last.get("content") or "")
+        own = self.counter.count_message(last)
+        allowed = own - (total - budget) - self.counter.per_message
+        if allowed <= 0 or not content:
+            return messages, total
+        cut = content[-int(len(content) * allowed / (own - self.counter.per_message)):]
+        while cut and self.counter.count(cut) > allowed:
+            cut = cut[len(cut) // 10 + 1:]
+        trimmed = dict(last, content=cut)
+        return messages[:-1] + [trimmed], total - own + self.counter.count_message(trimmed)
+
+class Message:
+    """One conversation turn, stored without a per-instance dict."""
+
+    __slots__ = ("role", "content", "tool_calls", "tool_call_id", "tokens")
+
+    def __init__(
+            self,
+            role: str,
+            content: Optional[str],
+            tool_calls: Optional[List[Dict[str, Any]]] = None,
+            tool_call_id: Optional[str] = None,
+            tokens: int = 0
+    ):
+        self.role = role
+        self.content = content
+        self.tool_calls = tool_calls
+        self.tool_call_id = tool_call_id
+        self.tokens = tokens
+
+    def to_dict(self) -> Dict[str, Any]:
+        message: Dict[str, Any] = {"role": self.role, "content": self.content}
+        if self.tool_calls:
+            message["tool_calls"] = self.tool_calls
+        if self.tool_call_id is not None:
+            message["tool_call_id"] = self.tool_call_id
+        return message
+
+class Conversation:
+    """
+    A multi-turn history with a running token count and bounded size.
+
+    Each turn is counted once, when it is added. When the history grows past
+    `max_tokens`, the oldest turns are evicted (an assistant tool call together
+    with its tool results). Without a `summarizer` they are simply dropped, a
+    sliding window. With one, the history is evicted down to half the budget so
+    the summarizer runs rarely, and the evicted turns are folded into a single
+    summary message kept after the system prompt.
+
+    Args:
+        system (str, optional): System prompt, never evicted. Defaults to None.
+        max_tokens (int, optional): Token budget for the history. Defaults to 32768.
+        counter (TokenCounter, optional): Token counter. Defaults to a shared heuristic counter.
+        summarizer (callable, optional): `summarizer(previous_summary, evicted_messages)`
+            returning the new summary text. Defaults to None.
+    """
+
+    __slots__ = ("system", "max_tokens", "counter", "summarizer", "summary", "_turns", "_tokens")
+
+    def __init__(
+            self,
+            system: Optional[str] = None,
+            max_tokens: int = 32768,
+            counter: Optional[TokenCounter] = None,
+            summarizer=None
+    ):
+        self.counter = counter or _default_counter()
+        self.max_tokens = max_tokens
+        self.summarizer = summarizer
+        self.system = self._message("system", system) if system is not None else None
+        self.summary: Optional[Message] = None
+        self._turns: deque = deque()
+        self._tokens = self.system.tokens if self.system is not None else 0
+
+    @property
+    def tokens(self) -> int:
+        """Tokens in the messages to_messages() would return."""
+        return self._tokens
+
+    def __len__(self) -> int:
+        return len(self._turns)
+
+    def add(
+            self,
+            role: str,
+            content: Optional[str],
+            tool_calls: Optional[List[Dict[str, Any]]] = None,
+            tool_call_id: Optional[str] = None
+    ) -> Message:
+        message = self._message(role, content, tool_calls, tool_call_id)
+        self._turns.append(message)
+        self._tokens += message.tokens
+        if self._tokens > self.max_tokens:
+            self._evict()
+        return message
+
+    def add_user(self, content: str) -> Message:
+        return self.add("user", content)
+
+    def add_response(self, response: Union[ChatCompletion, StreamAssembler, Dict[str, Any]]) -> Message:
+        """Append the assistant message of a ChatCompletion, a finished StreamAssembler or a dict."""
+        if isinstance(response, StreamAssembler):
+            message = response.message()
+        elif isinstance(response, dict):
+            message = response
+        else:
+            message = response.choices[0].message.model_dump(exclude_none=True)
+        return self.add("assistant", message.get("content"), message.get("tool_calls"))
+
+    def to_messages(self) -> List[Dict[str, Any]]:
+        """The history as request messages."""
+        messages = []
+        if self.system is not None:
+            messages.append(self.system.to_dict())
+        if self.summary is not None:
+            messages.append(self.summary.to_dict())
+        messages.extend(message.to_dict() for message in self._turns)
+        return messages
+
+    def _message(self, role, content, tool_calls=None, tool_call_id=None) -> Message:
+        message = Message(role, content, tool_calls, tool_call_id)
+        message.tokens = self.counter.count_message(message.to_dict())
+        return message
+
+    def _evict(self) -> None:
+        target = self.max_tokens if self.summarizer is None else self.max_tokens // 2
+        evicted = []
+        while self._tokens > target and self._turns:
+            # A tool call and its results go together; the latest turn or group is always kept
+            size = 1
+            if self._turns[0].tool_calls:
+                while size < len(self._turns) and self._turns[size].role == "tool":
+                    size += 1
+            if size >= len(self._turns):
+                break
+            for _ in range(size):
+                evicted.append(self._turns.popleft())
+                self._tokens -= evicted[-1].tokens
+        if not evicted or self.summarizer is None:
+            return
+        previous = self.summary.content if self.summary is not None else None
+        text = self.summarizer(previous, [message.to_dict() for message in evicted])
+        if self.summary is not None:
+            self._tokens -= self.summary.tokens
+        self.summary = self._message("system", f"Summary of the earlier conversation: {text}")
+        self._tokens += self.summary.tokens
+
+_shared_counter: Optional[TokenCounter] = None
+
+def _default_counter() -> TokenCounter:
+    global _shared_counter
+    if _shared_counter is None:
+        _shared_counter = TokenCounter()
+    return _shared_counter
+
+class _TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take `amount` (possibly into debt) and return how long to wait for it."""
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+        return 0.0 if self.level >= 0 else -self.level / self.rate
+
+    def charge(self, amount: float, now: float) -> None:
+        """Take `amount` after the fact; the debt delays later reservations."""
+        self._refill(now)
+        self.level -= amount
+
+    def refund(self, amount: float) -> None:
+        self.level = min(self.capacity, self.level + amount)
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+class RateLimiter:
+    """
+    Token-bucket limiter for requests per minute and tokens per minute.
+
+    One instance can be shared by any number of DeepSeekClients, threads and
+    event loops. Callers reserve capacity up front and wait out any debt, so
+    bursts are smoothed in arrival order instead of racing for the quota. A 429
+    pauses every caller until the server's Retry-After has passed.
+
+    Args:
+        requests_per_minute (int, optional): Request quota. Defaults to None (unlimited).
+        tokens_per_minute (int, optional): Token quota. Defaults to None (unlimited).
+    """
+
+    def __init__(
+            self,
+            requests_per_minute: Optional[int] = None,
+            tokens_per_minute: Optional[int] = None
+    ):
+        self._requests = _TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = _TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: int = 0) -> float:
+        """Reserve one request and `tokens` tokens; return the seconds to wait first."""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._blocked_until - now)
+            if self._requests is not None:
+                wait = max(wait, self._requests.reserve(1, now))
+            if self._tokens is not None and tokens:
+                wait = max(wait, self._tokens.reserve(tokens, now))
+            return wait
+
+    def acquire(self, tokens: int = 0) -> None:
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: int = 0) -> None:
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def settle(self, reserved: int, used: int) -> None:
+        """
+        Correct a reservation of `reserved` tokens to the `used` tokens the call
+        actually consumed: refund the surplus, or charge the shortfall as debt.
+        """
+        if self._tokens is None:
+            return
+        with self._lock:
+            # reserve() never takes more than the bucket holds
+            taken = min(reserved, self._tokens.capacity)
+            if used < taken:
+                self._tokens.refund(taken - used)
+            elif used > taken:
+                self._tokens.charge(used - taken, time.monotonic())
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every caller for `seconds`, e.g. after a 429."""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+    def utilization(self) -> float:
+        """How much of the fuller bucket is in use right now (1.0 or more when callers must wait)."""
+        with self._lock:
+            now = time.monotonic()
+            if self._blocked_until > now:
+                return 1.0
+            used = 0.0
+            for bucket in (self._requests, self._tokens):
+                if bucket is not None:
+                    level = min(bucket.capacity, bucket.level + (now - bucket.updated) * bucket.rate)
+                    used = max(used, 1.0 - level / bucket.capacity)
+            return used
+
+class _APIKey:
+    __slots__ = ("key", "limiter", "in_flight", "quarantined_until")
+
+    def __init__(self, key: str, limiter: Optional[RateLimiter]):
+        self.key = key
+        self.limiter = limiter
+        self.in_flight = 0
+        self.quarantined_until = 0.0
+
+class KeyPool:
+    """
+    Spreads requests over several API keys, each with its own RateLimiter.
+
+    Each request attempt takes the available key with the lowest utilization
+    (the fuller of its request and token buckets), breaking ties by requests
+    awaiting a response. A key that fails with an auth or quota error (401,
+    402, 403 or a quota 429) is quarantined and the retry moves to another key.
+
+    Args:
+        api_keys (list): The API keys to spread requests over.
+        requests_per_minute (int, optional): Request quota of each key. Defaults to None.
+        tokens_per_minute (int, optional): Token quota of each key. Defaults to None.
+        quarantine (float, optional): Seconds a failing key is left out. Defaults to 300.
+    """
+
+    def __init__(
+            self,
+            api_keys: List[str],
+            requests_per_minute: Optional[int] = None,
+            tokens_per_minute: Optional[int] = None,
+            quarantine: float = 300.0
+    ):
+        if not api_keys:
+            raise ValueError("KeyPool needs at least one API key")
+        self.keys = [
+            _APIKey(key, RateLimiter(requests_per_minute, tokens_per_minute)
+                    if requests_per_minute or tokens_per_minute else None)
+            for key in api_keys
+        ]
+        self.quarantine_seconds = quarantine
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        """True while at least one key is not quarantined."""
+        now = time.monotonic()
+        return any(key.quarantined_until <= now for key in self.keys)
+
+    def acquire(self) -> _APIKey:
+        with self._lock:
+            now = time.monotonic()
+            available = [key for key in self.keys if key.quarantined_until <= now]
+            if not available:
+                raise DeepSeekAPIError("Every API key in the pool is quarantined")
+            key = min(available, key=lambda key: (key.limiter.utilization() if key.limiter else 0.0, key.in_flight))
+            key.in_flight += 1
+            return key
+
+    def release(self, key: _APIKey) -> None:
+        with self._lock:
+            key.in_flight -= 1
+
+    def quarantine(self, key: _APIKey, seconds: Optional[float] = None) -> None:
+        seconds = self.quarantine_seconds if seconds is None else seconds
+        with self._lock:
+            key.quarantined_until = time.monotonic() + seconds
+        logger.warning("API key ...%s quarantined for %.0fs", key.key[-4:], seconds)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        return [
+            {
+                "key": "..." + key.key[-4:],
+                "in_flight": key.in_flight,
+                "utilization": key.limiter.utilization() if key.limiter else 0.0,
+                "quarantined_for": max(0.0, key.quarantined_until - now)
+            }
+            for key in self.keys
+        ]
+
+def _is_retryable(error: Exception) -> bool:
+    import openai
+    return isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError))
+
+def _is_rate_limited(error: Exception) -> bool:
+    import openai
+    return isinstance(error, openai.RateLimitError)
+
+def _is_key_error(error: Exception) -> bool:
+    """Auth failures, exhausted balance (402) and quota 429s, which another key may not hit."""
+    import openai
+    if isinstance(error, (openai.AuthenticationError, openai.PermissionDeniedError)):
+        return True
+    if isinstance(error, openai.APIStatusError) and error.status_code == 402:
+        return True
+    return isinstance(error, openai.RateLimitError) and "quota" in str(error).lower()
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000.0
+        if "retry-after" in headers:
+            value = headers["retry-after"]
+            try:
+                return float(value)
+            except ValueError:
+                from email.utils import parsedate_to_datetime
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+    return None
+
+def _backoff(attempt: int, error: Exception, base: float = 0.5, cap: float = 30.0) -> float:
+    """Jittered delay before retry number `attempt`, honoring Retry-After."""
+    retry_after = _retry_after(error)
+    if retry_after is not None:
+        return min(cap, retry_after) * random.uniform(1.0, 1.2)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+class LatencyTracker:
+    """
+    Sliding window of recent successful request latencies, per model.
+
+    Args:
+        window (int, optional): Samples kept per model. Defaults to 512.
+        max_age (float, optional): Seconds after which a sample is forgotten.
+            Defaults to None (samples only leave the window when it is full).
+    """
+
+    def __init__(self, window: int = 512, max_age: Optional[float] = None):
+        self.window = window
+        self.max_age = max_age
+        # (monotonic time, seconds) pairs, oldest first
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.get(model)
+            if samples is None:
+                samples = self._samples[model] = deque(maxlen=self.window)
+            samples.append((time.monotonic(), seconds))
+
+    def count(self, model: str) -> int:
+        with self._lock:
+            return len(self._fresh(model))
+
+    def percentile(self, model: str, percentile: float) -> Optional[float]:
+        """The `percentile` (0-100) latency of `model`, or None without samples."""
+        with self._lock:
+            samples = sorted(seconds for _, seconds in self._fresh(model))
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * percentile / 100.0))
+        return samples[index]
+
+    def _fresh(self, model: str) -> deque:
+        samples = self._samples.get(model, deque())
+        if self.max_age is not None:
+            expired = time.monotonic() - self.max_age
+            while samples and samples[0][0] < expired:
+                samples.popleft()
+        return samples
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+class SingleFlight:
+    """
+    Collapses concurrent calls that share a key into one execution whose
+    result (or exception) is handed to every caller.
+
+    `do` coalesces across threads; `do_async` coalesces across tasks on the
+    same event loop.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._tasks: Dict[Tuple[asyncio.AbstractEventLoop, str], asyncio.Task] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = fn()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+    async def do_async(self, key: str, fn):
+        """
+        Await `fn()` once per key. The shared call runs in its own task, so a
+        cancelled caller does not cancel it for the others.
+        """
+        loop = asyncio.get_running_loop()
+        task_key = (loop, key)
+        with self._lock:
+            task = self._tasks.get(task_key)
+            if task is None:
+                task = self._tasks[task_key] = loop.create_task(fn())
+                task.add_done_callback(lambda _: self._forget(task_key))
+        return await asyncio.shield(task)
+
+    def _forget(self, task_key: Tuple[asyncio.AbstractEventLoop, str]) -> None:
+        with self._lock:
+            self._tasks.pop(task_key, None)
+
+class ModelRouter(Observer):
+    """
+    Picks a model per call from live latency and error rates.
+
+    The router observes every call of the client it is attached to. A model
+    whose error rate over the last `window` calls exceeds `max_error_rate` is
+    treated as degraded for `cooldown` seconds and is only used as a last resort.
+    Latency samples older than `max_age` are forgotten, so a model that was
+    routed around for being slow falls back to its prior and is tried again.
+
+    Args:
+        models (tuple, optional): Candidate models, most preferred first.
+            Defaults to ("deepseek-reasoner", "deepseek-chat").
+        percentile (float, optional): Latency percentile compared against a budget.
+            Defaults to 95.
+        min_samples (int, optional): Samples needed before a model's latency is trusted;
+            until then `priors` (or an optimistic guess) is used. Defaults to 10.
+        priors (dict, optional): Expected latency in seconds per model before enough
+            samples exist. Defaults to None.
+        window (int, optional): Outcomes kept per model for the error rate. Defaults to 50.
+        max_error_rate (float, optional): Error rate that marks a model degraded.
+            Defaults to 0.5.
+        cooldown (float, optional): Seconds a degraded model is avoided. Defaults to 30.
+        max_age (float, optional): Seconds a latency sample is trusted. Defaults to 300.
+    """
+
+    def __init__(
+            self,
+            models: Tuple[str, ...] = ("deepseek-reasoner", "deepseek-chat"),
+            percentile: float = 95,
+            min_samples: int = 10,
+            priors: Optional[Dict[str, float]] = None,
+            window: int = 50,
+            max_error_rate: float = 0.5,
+            cooldown: float = 30.0,
+            max_age: float = 300.0
+    ):
+        self.models = tuple(models)
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.priors = dict(priors or {})
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+        self.latency = LatencyTracker(window=256, max_age=max_age)
+        self._outcomes: Dict[str, deque] = {model: deque(maxlen=window) for model in self.models}
+        self._degraded_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def on_call(self, call: CallMetrics) -> None:
+        if call.model not in self._outcomes or call.cached:
+            return
+        ok = call.error is None
+        if ok:
+            latency = call.time_to_first_byte if call.stream else call.latency
+            if latency is not None:
+                self.latency.record(call.model, latency)
+        with self._lock:
+            outcomes = self._outcomes[call.model]
+            outcomes.append(ok)
+            if len(outcomes) >= min(self.min_samples, outcomes.maxlen) and \
+                    outcomes.count(False) / len(outcomes) > self.max_error_rate:
+                self._degraded_until[call.model] = time.monotonic() + self.cooldown
+                outcomes.clear()
+
+    def estimate(self, model: str) -> Optional[float]:
+        """The expected latency of `model` at the router's percentile, if known."""
+        if self.latency.count(model) >= self.min_samples:
+            return self.latency.percentile(model, self.percentile)
+        return self.priors.get(model)
+
+    def error_rate(self, model: str) -> float:
+        with self._lock:
+            outcomes = self._outcomes.get(model)
+            return outcomes.count(False) / len(outcomes) if outcomes else 0.0
+
+    def degraded(self, model: str) -> bool:
+        with self._lock:
+            return self._degraded_until.get(model, 0.0) > time.monotonic()
+
+    def rank(self, latency_budget: Optional[float] = None, prefer: Optional[str] = None) -> List[str]:
+        """
+        Candidate models, best first: healthy models expected to fit the budget in
+        preference order, then other healthy models fastest first, then degraded ones.
+        Without a budget, a healthy `prefer` comes before the other models.
+        """
+        models = self.models
+        if latency_budget is None and prefer in models:
+            models = (prefer,) + tuple(model for model in models if model != prefer)
+        healthy = [model for model in models if not self.degraded(model)]
+        degraded = [model for model in models if model not in healthy]
+
+        def fits(model):
+            estimate = self.estimate(model)
+            return latency_budget is None or estimate is None or estimate <= latency_budget
+
+        def expected(model):
+            estimate = self.estimate(model)
+            return estimate if estimate is not None else float("inf")
+
+        fitting = [model for model in healthy if fits(model)]
+        over_budget = sorted((model for model in healthy if not fits(model)), key=expected)
+        return fitting + over_budget + sorted(degraded, key=self.error_rate)
+
+class Tool:
+    """A registered tool: its handler, JSON schema and timeout."""
+
+    __slots__ = ("name", "handler", "description", "parameters", "timeout")
+
+    def __init__(self, name, handler, description, parameters, timeout):
+        self.name = name
+        self.handler = handler
+        self.description = description
+        self.parameters = parameters
+        self.timeout = timeout
+
+    def spec(self) -> Dict[str, Any]:
+        return {
+            "type": "function",
+            "function": {"name": self.name, "description": self.description, "parameters": self.parameters}
+        }
+
+def _parameters_from_signature(handler: Callable) -> Dict[str, Any]:
+    signature = inspect.signature(handler)
+    return {
+        "type": "object",
+        "properties": {name: {} for name in signature.parameters},
+        "required": [name for name, parameter in signature.parameters.items() if parameter.default is parameter.empty]
+    }
+
+class ToolRunner:
+    """
+    Function-calling loop: sends the registered tools, runs every tool call of
+    a response concurrently, appends the results and asks again until the
+    model answers without tool calls.
+
+    Sync handlers run on a thread pool; in arun() coroutine handlers are awaited
+    on the loop. A handler that raises or outlives its timeout is reported to
+    the model as `{"error": ...}` instead of failing the loop. A timed-out
+    thread cannot be stopped and finishes in the background.
+
+    Args:
+        client (DeepSeekClient): Client used for the requests.
+        max_workers (int, optional): Threads for sync handlers. Defaults to 8.
+        timeout (float, optional): Default per-tool timeout in seconds. Defaults to 30.0.
+        max_rounds (int, optional): Requests allowed before giving up. Defaults to 8.
+    """
+
+    def __init__(self, client: DeepSeekClient, max_workers: int = 8, timeout: float = 30.0, max_rounds: int = 8):
+        self.client = client
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_rounds = max_rounds
+        self.tools: Dict[str, Tool] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def register(
+            self,
+            handler: Optional[Callable] = None,
+            name: Optional[str] = None,
+            description: str = "",
+            parameters: Optional[Dict[str, Any]] = None,
+            timeout: Optional[float] = None
+    ):
+        """
+        Register `handler` as a tool, directly or as a decorator. Without
+        `parameters` the schema lists the handler's arguments untyped.
+        """
+        def decorate(handler: Callable) -> Callable:
+            tool_name = name or handler.__name__
+            self.tools[tool_name] = Tool(
+                tool_name,
+                handler,
+                description or inspect.getdoc(handler) or "",
+                parameters or _parameters_from_signature(handler),
+                timeout if timeout is not None else self.timeout
+            )
+            return handler
+        return decorate if handler is None else decorate(handler)
+
+    def specs(self) -> List[Dict[str, Any]]:
+        """The `tools=` request parameter."""
+        return [tool.spec() for tool in self.tools.values()]
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="deepseek-tool")
+            return self._executor
+
+    def run(self, messages: List[Dict[str, Any]], model: Optional[str] = None, **kwargs):
+        """Run the loop and return the final response; `messages` is not modified."""
+        messages = list(messages)
+        for _ in range(self.max_rounds):
+            response = self.client.chat_completion(messages, model=model, tools=self.specs(), **kwargs)
+            calls = self._tool_calls(response, messages)
+            if not calls:
+                return response
+            started = time.monotonic()
+            futures = [self._submit(call) for call in calls]
+            for call, (tool, future) in zip(calls, futures):
+                if future is None:
+                    result = tool
+                else:
+                    try:
+                        result = future.result(timeout=max(0.0, started + tool.timeout - time.monotonic()))
+                    except Exception as e:
+                        result = self._error(tool, e)
+                messages.append(self._result_message(call, result))
+        raise DeepSeekError(f"Tool loop did not finish within {self.max_rounds} requests")
+
+    async def arun(self, messages: List[Dict[str, Any]], model: Optional[str] = None, **kwargs):
+        """Async counterpart of run."""
+        messages = list(messages)
+        for _ in range(self.max_rounds):
+            response = await self.client.async_chat_completion(messages, model=model, tools=self.specs(), **kwargs)
+            calls = self._tool_calls(response, messages)
+            if not calls:
+                return response
+            results = await asyncio.gather(*(self._acall(call) for call in calls))
+            messages.extend(self._result_message(call, result) for call, result in zip(calls, results))
+        raise DeepSeekError(f"Tool loop did not finish within {self.max_rounds} requests")
+
+    @staticmethod
+    def _tool_calls(response, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Append the assistant turn of a response of any result_type; returns its tool calls as dicts."""
+        if isinstance(response, CompletionResult):
+            content, calls = response.content, response.tool_calls
+        elif isinstance(response, dict):
+            message = response["choices"][0]["message"]
+            content, calls = message.get("content"), message.get("tool_calls")
+        else:
+            message = response.choices[0].message
+            content = message.content
+            calls = [call.model_dump(exclude_none=True) for call in message.tool_calls or ()]
+        if not calls:
+            return []
+        messages.append({"role": "assistant", "content": content or "", "tool_calls": calls})
+        return calls
+
+    def _prepare(self, call) -> Tuple[Optional[Tool], Any]:
+        """The tool and arguments for `call`, or (None, error result)."""
+        function = call["function"]
+        tool = self.tools.get(function["name"])
+        if tool is None:
+            return None, {"error": f"Unknown tool {function['name']!r}"}
+        try:
+            arguments = json.loads(function.get("arguments") or "{}")
+        except ValueError as e:
+            return None, {"error": f"Invalid arguments: {str(e)}"}
+        if not isinstance(arguments, dict):
+            return None, {"error": f"Invalid arguments: expected a JSON object, got {type(arguments).__name__}"}
+        return tool, arguments
+
+    def _submit(self, call):
+        tool, arguments = self._prepare(call)
+        if tool is None:
+            return arguments, None
+        try:
+            if inspect.iscoroutinefunction(tool.handler):
+                return tool, self.executor.submit(asyncio.run, tool.handler(**arguments))
+            return tool, self.executor.submit(tool.handler, **arguments)
+        except Exception as e:
+            return self._error(tool, e), None
+
+    async def _acall(self, call) -> Any:
+        tool, arguments = self._prepare(call)
+        if tool is None:
+            return arguments
+        try:
+            if inspect.iscoroutinefunction(tool.handler):
+                pending = tool.handler(**arguments)
+            else:
+                pending = asyncio.get_running_loop().run_in_executor(
+                    self.executor, functools.partial(tool.handler, **arguments)
+                )
+            return await asyncio.wait_for(pending, tool.timeout)
+        except Exception as e:
+            return self._error(tool, e)
+
+    @staticmethod
+    def _error(tool: Tool, error: Exception) -> Dict[str, str]:
+        if isinstance(error, (TimeoutError, asyncio.TimeoutError, FuturesTimeoutError)):
+            return {"error": f"Tool {tool.name!r} timed out after {tool.timeout:g}s"}
+        logger.warning("Tool %r failed: %s", tool.name, error)
+        return {"error": f"{type(error).__name__}: {str(error)}"}
+
+    @staticmethod
+    def _result_message(call, result: Any) -> Dict[str, str]:
+        content = result if isinstance(result, str) else json.dumps(result, default=str)
+        return {"role": "tool", "tool_call_id": call["id"], "content": content}
+
+_END = object()
+
+class StreamSubscription:
+    """
+    One consumer's bounded view of a StreamFanout; iterate it with `async for`,
+    preferably inside `async with subscription:` so leaving early unsubscribes.
+
+    `policy` decides what happens when the queue is full: "block" holds back the
+    whole stream (backpressure), "drop" skips chunks for this consumer only and
+    counts them in `dropped`, and "disconnect" ends this consumer with
+    DeepSeekStreamOverrunError. The subscription is also closed when the task
+    that first iterated it finishes, so a consumer that dies without aclose()
+    cannot stall a "block" stream.
+    """
+
+    POLICIES = ("block", "drop", "disconnect")
+
+    def __init__(self, maxsize: int = 64, policy: str = "block"):
+        if policy not in self.POLICIES:
+            raise ValueError(f"policy must be one of {self.POLICIES}")
+        self.policy = policy
+        self.dropped = 0
+        self.closed = False
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self._error: Optional[BaseException] = None
+        self._detached = False
+        self._space: Optional[asyncio.Future] = None
+        self._consumer: Optional[asyncio.Task] = None
+
+    async def _offer(self, chunk: ChatCompletionChunk) -> None:
+        if self.closed:
+            return
+        if self.policy == "block":
+            if await self._wait_for_space():
+                self._queue.put_nowait(chunk)
+        elif not self._queue.full():
+            self._queue.put_nowait(chunk)
+        elif self.policy == "drop":
+            self.dropped += 1
+        else:
+            await self._finish(DeepSeekStreamOverrunError("Stream consumer fell behind and was disconnected"))
+
+    async def _wait_for_space(self) -> bool:
+        """Wait for room in the queue; False if the consumer went away meanwhile."""
+        while self._queue.full() and not self._detached:
+            self._space = asyncio.get_running_loop().create_future()
+            await self._space
+        return not self._detached
+
+    def _wake(self) -> None:
+        if self._space is not None and not self._space.done():
+            self._space.set_result(None)
+
+    async def _finish(self, error: Optional[BaseException] = None) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        if error is not None:
+            self._error = error
+            self._drain()
+        if await self._wait_for_space():
+            self._queue.put_nowait(_END)
+
+    def _drain(self) -> None:
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> ChatCompletionChunk:
+        if self._consumer is None:
+            self._consumer = asyncio.current_task()
+            if self._consumer is not None:
+                self._consumer.add_done_callback(lambda task: self._close())
+        if self._detached:
+            raise StopAsyncIteration
+        item = await self._queue.get()
+        self._wake()
+        if item is _END or self._detached:
+            self._queue.put_nowait(_END)
+            if self._error is not None and not self._detached:
+                raise self._error
+            raise StopAsyncIteration
+        return item
+
+    async def __aenter__(self) -> StreamSubscription:
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Stop consuming; the stream no longer waits for this subscriber."""
+        self._close()
+
+    def _close(self) -> None:
+        if self._detached:
+            return
+        self.closed = True
+        self._detached = True
+        self._drain()
+        self._wake()
+        # Ends an __anext__ waiting in another task; the fanout no longer puts anything
+        self._queue.put_nowait(_END)
+
+class StreamFanout:
+    """
+    Feeds one upstream chunk stream to several consumers, each through its own
+    bounded queue. Subscribe every consumer, then await run() alongside them.
+
+    The upstream stream is closed as soon as every subscriber has gone away.
+    run() is not cancelled when a consumer fails under asyncio.gather; it ends
+    once the failed consumer's subscription is closed and the others finish.
+    """
+
+    def __init__(self, source: AsyncGenerator[ChatCompletionChunk, None]):
+        self.source = source
+        self.subscribers: List[StreamSubscription] = []
+
+    def subscribe(self, maxsize: int = 64, policy: str = "block") -> StreamSubscription:
+        subscription = StreamSubscription(maxsize, policy)
+        self.subscribers.append(subscription)
+        return subscription
+
+    async def run(self) -> None:
+        error = None
+        try:
+            async for chunk in self.source:
+                live = [subscription for subscription in self.subscribers if not subscription.closed]
+                if not live:
+                    break
+                for subscription in live:
+                    await subscription._offer(chunk)
+        except Exception as e:
+            error = e
+        finally:
+            await self.source.aclose()
+            for subscription in self.subscribers:
+                await subscription._finish(error)
+
+class CancellationToken:
+    """
+    A thread-safe flag for abandoning streams from elsewhere, e.g. when the user
+    disconnects. Cancelling it closes every stream it was passed to.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._callbacks: List[Callable[[], None]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def register(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Run `callback` on cancellation (now, if already cancelled); returns an unregister function."""
+        with self._lock:
+            if not self._cancelled:
+                self._callbacks.append(callback)
+                return functools.partial(self._unregister, callback)
+        callback()
+        return lambda: None
+
+    def _unregister(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+class _StreamStop:
+    """Deadline, cancellation and stop predicates for one stream."""
+
+    # A stop_pattern match must fit in this many trailing characters plus the newest delta
+    WINDOW = 256
+
+    def __init__(
+            self,
+            deadline: Optional[float],
+            cancel: Optional[CancellationToken],
+            pattern: Union[str, re.Pattern, None],
+            max_tokens: Optional[int]
+    ):
+        self.deadline = deadline
+        self.cancel = cancel
+        self.pattern = re.compile(pattern) if isinstance(pattern, str) else pattern
+        self.max_tokens = max_tokens
+        self.tokens = 0
+        self.reason: Optional[str] = None
+        self._tail = ""
+        self._counter = _default_counter() if max_tokens is not None else None
+        self._started = time.monotonic()
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - (time.monotonic() - self._started))
+
+    @property
+    def active(self) -> bool:
+        return any(value is not None for value in (self.deadline, self.cancel, self.pattern, self.max_tokens))
+
+    def fire(self, reason: str) -> None:
+        if self.reason is None:
+            self.reason = reason
+
+    def update(self, chunk: Union[ChatCompletionChunk, StreamDelta]) -> bool:
+        """Account for `chunk`; True once the stream should stop after it."""
+        if isinstance(chunk, StreamDelta):
+            delta = chunk
+        elif chunk.choices:
+            delta = chunk.choices[0].delta
+        else:
+            return self.reason is not None
+        content = delta.content or ""
+        if self._counter is not None:
+            self.tokens += self._counter.count(content) + self._counter.count(
+                getattr(delta, "reasoning_content", None) or ""
+            )
+            if self.tokens >= self.max_tokens:
+                self.fire("max_tokens")
+        if self.pattern is not None and content:
+            text = self._tail + content
+            if self.pattern.search(text):
+                self.fire("pattern")
+            self._tail = text[-self.WINDOW:]
+        return self.reason is not None
+
+    def arm(self, interrupt: Callable[[], None]) -> Callable[[], None]:
+        """Call `interrupt` from a timer thread or the cancelling thread; returns a disarm function."""
+        disarm = []
+        if self.cancel is not None:
+            disarm.append(self.cancel.register(lambda: (self.fire("cancelled"), interrupt())))
+        if self.deadline is not None:
+            timer = threading.Timer(self.remaining(), lambda: (self.fire("deadline"), interrupt()))
+            timer.daemon = True
+            timer.start()
+            disarm.append(timer.cancel)
+        return lambda: [undo() for undo in disarm]
+
+    def arm_async(self, interrupt: Callable[[], None]) -> Callable[[], None]:
+        """Like arm, but runs `interrupt` on the running event loop."""
+        loop = asyncio.get_running_loop()
+        disarm = []
+        if self.cancel is not None:
+            disarm.append(self.cancel.register(
+                lambda: (self.fire("cancelled"), loop.call_soon_threadsafe(interrupt))
+            ))
+        if self.deadline is not None:
+            handle = loop.call_later(self.remaining(), lambda: (self.fire("deadline"), interrupt()))
+            disarm.append(handle.cancel)
+        return lambda: [undo() for undo in disarm]
+
+def _abort_stream(stream) -> None:
+    """
+    Close a sync SDK stream from another thread. Closing alone does not wake a
+    read already blocked on the socket, so an HTTP/1.1 socket is shut down
+    first; an HTTP/2 connection is shared with other streams and is left open.
+    """
+    response = getattr(stream, "response", stream)
+    network_stream = response.extensions.get("network_stream")
+    if network_stream is not None and response.http_version == "HTTP/1.1":
+        sock = network_stream.get_extra_info("socket")
+        if sock is not None:
+            with contextlib.suppress(OSError):
+                sock.shutdown(socket.SHUT_RDWR)
+    stream.close()
+
 class DeepSeekClient:
     """
     A client for interacting with DeepSeek's language models.
 
     Args:
-        api_key (str): Your DeepSeek API key
+        api_key (str, optional): Your DeepSeek API key. May be omitted with a key_pool.
         base_url (str, optional): Base API URL. Defaults to "https://api.deepseek.com".
         default_model (str, optional): Default model to use. Defaults to "deepseek-chat".
+        pool (ConnectionPool, optional): Connection pool to send requests through.
+            Defaults to the process-wide pool for `(base_url, api_key)`.
+        cache (ResponseCache, optional): Cache for deterministic requests, those with
+            `temperature=0` or a `seed`. Defaults to None.
+        rate_limiter (RateLimiter, optional): Limiter shared by the sync and async paths.
+            Defaults to None.
+        max_retries (int, optional): Retries for 429, 5xx and connection errors, with
+            jittered backoff that honors Retry-After. Defaults to 2.
+        latency_tracker (LatencyTracker, optional): Where non-streaming latencies are
+            recorded; hedged requests read it. Defaults to a new tracker.
+        observers (list, optional): Observers notified with a CallMetrics after every
+            call. Defaults to None.
+        single_flight (bool, optional): Send only one upstream request for identical
+            non-streaming requests that are in flight at the same time, and give
+            every caller the shared response. Defaults to False.
+        router (ModelRouter, optional): Chooses the model for calls that do not name
+            one, optionally within a `latency_budget`; without a budget it prefers
+            `default_model` while that is healthy. Defaults to None.
+        preflight (ContextPreflight, optional): Trims history to the model's context
+            window and sets `max_tokens` before each request. Defaults to None.
+        result_type (str, optional): What non-streaming chat completions return: a
+            ChatCompletion ("completion"), a CompletionResult ("result") or the decoded
+            JSON dict ("dict"). The last two skip the SDK's pydantic parsing.
+            Defaults to "completion".
+        key_pool (KeyPool, optional): Spread requests over several API keys instead of
+            using `api_key` alone. Defaults to None.
     """
 
     def __init__(
             self,
-            api_key: str,
+            api_key: Optional[str] = None,
             base_url: str = "https://api.deepseek.com",
-            default_model: str = "deepseek-chat"
+            default_model: str = "deepseek-chat",
+            pool: Optional[ConnectionPool] = None,
+            cache: Optional[ResponseCache] = None,
+            rate_limiter: Optional[RateLimiter] = None,
+            max_retries: int = 2,
+            latency_tracker: Optional[LatencyTracker] = None,
+            observers: Optional[List[Observer]] = None,
+            single_flight: bool = False,
+            router: Optional[ModelRouter] = None,
+            preflight: Optional[ContextPreflight] = None,
+            result_type: str = "completion",
+            key_pool: Optional[KeyPool] = None
     ):
-        self.client = OpenAI(api_key=api_key, base_url=base_url)
-        self.async_client = AsyncOpenAI(api_key=api_key, base_url=base_url)
+        if result_type not in RESULT_TYPES:
+            raise ValueError(f"result_type must be one of {RESULT_TYPES}")
+        if api_key is None:
+            if key_pool is None:
+                raise ValueError("DeepSeekClient needs an api_key or a key_pool")
+            api_key = key_pool.keys[0].key
+        self.api_key = api_key
+        self.base_url = base_url
+        self.pool = pool or get_connection_pool(api_key, base_url)
+        self._client: Optional[OpenAI] = None
+        self._async_client: Optional[AsyncOpenAI] = None
+        self._async_clients: Dict[Any, AsyncOpenAI] = {}
+        self._client_lock = threading.Lock()
         self.default_model = default_model
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.latency_tracker = latency_tracker or LatencyTracker()
+        self.observers = list(observers or ())
+        self.single_flight = SingleFlight() if single_flight else None
+        self.router = router
+        self.preflight = preflight
+        self.result_type = result_type
+        self.key_pool = key_pool
+        self._sdk_clients: Dict[Tuple[str, Optional[str]], Tuple[Any, Any]] = {}
+        if router is not None and router not in self.observers:
+            self.observers.append(router)
+
+    @property
+    def client(self) -> OpenAI:
+        """The sync OpenAI SDK client, built on first use."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from openai import OpenAI
+                    self._client = OpenAI(
+                        api_key=self.api_key,
+                        base_url=self.base_url,
+                        http_client=self.pool.sync_client,
+                        max_retries=0
+                    )
+        return self._client
+
+    @client.setter
+    def client(self, client: OpenAI) -> None:
+        self._client = client
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        """The async OpenAI SDK client for the running event loop, built on first use."""
+        if self._async_client is not None:
+            return self._async_client
+        loop = _running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            with self._client_lock:
+                client = self._async_clients.get(loop)
+                if client is None:
+                    _forget_closed_loops(self._async_clients)
+                    from openai import AsyncOpenAI
+                    client = self._async_clients[loop] = AsyncOpenAI(
+                        api_key=self.api_key,
+                        base_url=self.base_url,
+                        http_client=self.pool.async_client,
+                        max_retries=0
+                    )
+        return client
+
+    @async_client.setter
+    def async_client(self, client: AsyncOpenAI) -> None:
+        self._async_client = client
+
+    @contextlib.contextmanager
+    def _observe(self, model: str, stream: bool = False):
+        call = CallMetrics(model, stream)
+        try:
+            yield call
+        except GeneratorExit:
+            # The consumer stopped reading a stream early; the call did not fail
+            raise
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            call.latency = time.perf_counter() - call._started_at
+            for observer in self.observers:
+                try:
+                    observer.on_call(call)
+                except Exception:
+                    logger.exception("DeepSeekClient observer %r failed", observer)
+
+    def _reserve(self, messages: List[Dict[str, Any]], max_tokens: Optional[int]) -> int:
+        """Tokens to take from the rate limiters before a request is sent."""
+        if self.preflight is None:
+            return estimate_tokens(messages, max_tokens)
+        return self.preflight.count(messages) + (max_tokens or 0)
+
+    def _create(self, call: CallMetrics, raw_stream: bool = False, **params):
+        reserved = self._reserve(params["messages"], params.get("max_tokens"))
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            key = self._acquire_key(last_error)
+            limiters = self._limiters(key)
+            if limiters:
+                queued = time.perf_counter()
+                for limiter in limiters:
+                    limiter.acquire(reserved)
+                call.queue_wait += time.perf_counter() - queued
+            token = _current_call.set(call)
+            try:
+                # The first call imports the SDK and builds its client; that is not network time
+                sdk_client = self._sdk("sync", key)
+                call._mark_sent()
+                sent_at = time.perf_counter()
+                if raw_stream or (self.result_type != "completion" and not params.get("stream")):
+                    body, options = _post_args(params)
+                    response = sdk_client.post(
+                        "/chat/completions", body=body, options=options, cast_to=http_library().Response, stream=raw_stream
+                    )
+                    if not raw_stream:
+                        response = json.loads(response.content)
+                else:
+                    response = sdk_client.chat.completions.create(**params)
+                if not params.get("stream"):
+                    self.latency_tracker.record(params["model"], time.perf_counter() - sent_at)
+                break
+            except Exception as e:
+                last_error = e
+                # A failed attempt consumed no tokens
+                for limiter in limiters:
+                    limiter.settle(reserved, 0)
+                if self._switch_key(key, e, attempt):
+                    continue
+                self._handle_error(e, attempt, limiters)
+                time.sleep(_backoff(attempt, e))
+            except BaseException:
+                for limiter in limiters:
+                    limiter.settle(reserved, 0)
+                raise
+            finally:
+                _current_call.reset(token)
+                if key is not None:
+                    self.key_pool.release(key)
+        if params.get("stream"):
+            if limiters:
+                call._reservation = (reserved, reserved - (params.get("max_tokens") or 0), limiters)
+            return response
+        self._settle(reserved, _field(_field(response, "usage"), "total_tokens"), limiters)
+        call.record_usage(_field(response, "usage"))
+        return response
+
+    async def _acreate(self, call: CallMetrics, raw_stream: bool = False, hedge: bool = False, **params):
+        reserved = self._reserve(params["messages"], params.get("max_tokens"))
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            key = self._acquire_key(last_error)
+            limiters = self._limiters(key)
+            if limiters:
+                queued = time.perf_counter()
+                try:
+                    for i, limiter in enumerate(limiters):
+                        await limiter.acquire_async(reserved)
+                except BaseException:
+                    # Cancelled while queued: acquire_async reserves before it waits
+                    for limiter in limiters[:i + 1]:
+                        limiter.settle(reserved, 0)
+                    if key is not None:
+                        self.key_pool.release(key)
+                    raise
+                call.queue_wait += time.perf_counter() - queued
+            token = _current_call.set(call)
+            try:
+                sdk_client = self._sdk("async", key)
+                # A hedge runs alongside the first attempt, whose send time the call keeps
+                if not hedge:
+                    call._mark_sent()
+                sent_at = time.perf_counter()
+                if raw_stream or (self.result_type != "completion" and not params.get("stream")):
+                    body, options = _post_args(params)
+                    response = await sdk_client.post(
+                        "/chat/completions", body=body, options=options, cast_to=http_library().Response, stream=raw_stream
+                    )
+                    if not raw_stream:
+                        response = json.loads(response.content)
+                else:
+                    response = await sdk_client.chat.completions.create(**params)
+                if not params.get("stream"):
+                    self.latency_tracker.record(params["model"], time.perf_counter() - sent_at)
+                break
+            except Exception as e:
+                last_error = e
+                for limiter in limiters:
+                    limiter.settle(reserved, 0)
+                if self._switch_key(key, e, attempt):
+                    continue
+                self._handle_error(e, attempt, limiters)
+                await asyncio.sleep(_backoff(attempt, e))
+            except BaseException:
+                # Cancelled, e.g. a losing hedge or a stream deadline: refund like a failure
+                for limiter in limiters:
+                    limiter.settle(reserved, 0)
+                raise
+            finally:
+                _current_call.reset(token)
+                if key is not None:
+                    self.key_pool.release(key)
+        if params.get("stream"):
+            if limiters:
+                call._reservation = (reserved, reserved - (params.get("max_tokens") or 0), limiters)
+            return response
+        self._settle(reserved, _field(_field(response, "usage"), "total_tokens"), limiters)
+        call.record_usage(_field(response, "usage"))
+        return response
+
+    async def _hedged_acreate(self, percentile: float, min_samples: int, call: CallMetrics, **params):
+        """
+        Send the request, and send a duplicate if it is still outstanding after
+        the `percentile` latency seen so far. The first success wins and the
+        loser is cancelled, which closes its connection.
+        """
+        delay = None
+        if self.latency_tracker.count(params["model"]) >= min_samples:
+            delay = self.latency_tracker.percentile(params["model"], percentile)
+        if delay is None:
+            return await self._acreate(call, **params)
+        tasks = {asyncio.ensure_future(self._acreate(call, **params))}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                tasks.add(asyncio.ensure_future(self._acreate(call, hedge=True, **params)))
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _handle_error(self, error: Exception, attempt: int, limiters: List[RateLimiter]) -> None:
+        """Raise the wrapped error unless the request should be retried."""
+        if _is_rate_limited(error):
+            # Pause the most specific limiter: the key's own, else the shared one
+            if limiters:
+                limiters[-1].pause(_retry_after(error) or 1.0)
+            if attempt >= self.max_retries:
+                raise DeepSeekRateLimitError(f"API Error: {str(error)}") from error
+        if not _is_retryable(error) or attempt >= self.max_retries:
+            raise DeepSeekAPIError(f"API Error: {str(error)}") from error
+
+    def _limiters(self, key: Optional[_APIKey]) -> List[RateLimiter]:
+        limiters = [self.rate_limiter] if self.rate_limiter is not None else []
+        if key is not None and key.limiter is not None:
+            limiters.append(key.limiter)
+        return limiters
+
+    def _acquire_key(self, last_error: Optional[Exception]) -> Optional[_APIKey]:
+        if self.key_pool is None:
+            return None
+        try:
+            return self.key_pool.acquire()
+        except DeepSeekAPIError as e:
+            # Another call quarantined the last key meanwhile; keep this call's own error
+            if last_error is None:
+                raise
+            raise e from last_error
+
+    def _switch_key(self, key: Optional[_APIKey], error: Exception, attempt: int) -> bool:
+        """
+        Quarantine `key` after an auth or quota error; True if the retry should
+        go to another key. With no key left, `error` is raised as if no retries
+        remained.
+        """
+        if key is None or not _is_key_error(error):
+            return False
+        self.key_pool.quarantine(key)
+        if not self.key_pool.available():
+            self._handle_error(error, self.max_retries, [])
+        return attempt < self.max_retries
+
+    def _sdk(self, kind: str, key: Optional[_APIKey]) -> Any:
+        """
+        The "sync" or "async" SDK client switched to `key`. It is cached: the SDK
+        rebuilds a client on every with_options().
+        """
+        base = self.client if kind == "sync" else self.async_client
+        api_key = key.key if key is not None else None
+        entry = self._sdk_clients.get((kind, api_key))
+        if entry is None or entry[0] is not base:
+            sdk_client = base if api_key is None else base.with_options(api_key=api_key)
+            entry = self._sdk_clients[(kind, api_key)] = (base, sdk_client)
+        return entry[1]
+
+    def _settle(self, reserved: int, used: Optional[int], limiters: List[RateLimiter]) -> None:
+        if used is not None:
+            for limiter in limiters:
+                limiter.settle(reserved, used)
+
+    def _settle_stream(self, call: CallMetrics, assembler: Optional[StreamAssembler]) -> None:
+        """
+        Settle a closed stream's reservation from its final usage chunk, else
+        from the prompt plus the assembled output counted locally. Without
+        either the reservation stands.
+        """
+        if call._reservation is None:
+            return
+        reserved, prompt, limiters = call._reservation
+        call._reservation = None
+        if call.prompt_tokens is not None and call.completion_tokens is not None:
+            used = call.prompt_tokens + call.completion_tokens
+        elif assembler is not None:
+            counter = self.preflight.counter if self.preflight is not None else _default_counter()
+            output = [assembler.content, assembler.reasoning_content]
+            output.extend(tool_call["function"]["arguments"] for tool_call in assembler.tool_calls)
+            used = prompt + sum(counter.count(text) for text in output if text)
+        else:
+            used = None
+        self._settle(reserved, used, limiters)
+
+    def _result(self, response):
+        """Convert a decoded response to the configured result_type."""
+        if self.result_type == "result" and isinstance(response, dict):
+            return CompletionResult.from_dict(response)
+        return response
+
+    def _cache_key(
+            self,
+            model: str,
+            messages: List[Dict[str, str]],
+            temperature: float,
+            max_tokens: Optional[int],
+            stream: bool,
+            kwargs: Dict
+    ) -> Optional[str]:
+        if self.cache is None or not is_deterministic(temperature, stream, **kwargs):
+            return None
+        return cache_key(model, messages, temperature=temperature, max_tokens=max_tokens, **kwargs)
+
+    def _route(self, model: Optional[str], latency_budget: Optional[float], stream: bool = False) -> List[str]:
+        """Models to try in order: the router's choice plus one fallback, or just `model`."""
+        if model is not None or self.router is None:
+            return [model or self.default_model]
+        # Without a budget there is nothing to trade off, so the client's default model leads
+        ranked = self.router.rank(latency_budget, prefer=self.default_model)
+        return ranked[:1] if stream else ranked[:2]
 
     def chat_completion(
             self,
@@ -37,11 +2619,46 @@ class DeepSeekClient:
             temperature: float = 0.7,
             max_tokens: Optional[int] = None,
             stream: bool = False,
+            latency_budget: Optional[float] = None,
             **kwargs
-    ) -> ChatCompletion:
-        model = model or self.default_model
-        try:
-            return self.client.chat.completions.create(
+    ) -> Union[ChatCompletion, CompletionResult, Dict[str, Any]]:
+        """
+        Create a chat completion, returned as the client's result_type.
+
+        When `model` is omitted and the client has a router, the router picks a
+        model expected to answer within `latency_budget` seconds, and a failed
+        call falls back to the next-best model once.
+        """
+        models = self._route(model, latency_budget, stream)
+        for attempt, model in enumerate(models):
+            try:
+                return self._chat_completion(messages, model, temperature, max_tokens, stream, kwargs)
+            except DeepSeekAPIError:
+                if attempt + 1 == len(models):
+                    raise
+
+    def _chat_completion(
+            self,
+            messages: List[Dict[str, str]],
+            model: str,
+            temperature: float,
+            max_tokens: Optional[int],
+            stream: bool,
+            kwargs: Dict
+    ) -> Union[ChatCompletion, CompletionResult, Dict[str, Any]]:
+        if self.preflight is not None:
+            messages, max_tokens = self.preflight.apply(model, messages, max_tokens)
+        with self._observe(model, stream) as call:
+            key = self._cache_key(model, messages, temperature, max_tokens, stream, kwargs)
+            if key is not None:
+                cached = self.cache.get(key, raw=self.result_type != "completion")
+                if cached is not None:
+                    call.cached = True
+                    call.record_usage(_field(cached, "usage"))
+                    return self._result(cached)
+            create = functools.partial(
+                self._create,
+                call,
                 model=model,
                 messages=messages,
                 temperature=temperature,
@@ -49,8 +2666,14 @@ class DeepSeekClient:
                 stream=stream,
                 **kwargs
             )
-        except Exception as e:
-            raise DeepSeekAPIError(f"API Error: {str(e)}") from e
+            if self.single_flight is not None and not stream:
+                flight_key = key or cache_key(model, messages, temperature=temperature, max_tokens=max_tokens, **kwargs)
+                response = self.single_flight.do(flight_key, create)
+            else:
+                response = create()
+            if key is not None:
+                self.cache.set(key, response)
+            return self._result(response)
 
     async def async_chat_completion(
             self,
@@ -59,11 +2682,57 @@ class DeepSeekClient:
             temperature: float = 0.7,
             max_tokens: Optional[int] = None,
             stream: bool = False,
+            latency_budget: Optional[float] = None,
+            hedge_percentile: Optional[float] = None,
+            hedge_min_samples: int = 20,
             **kwargs
-    ) -> ChatCompletion:
-        model = model or self.default_model
-        try:
-            return await self.async_client.chat.completions.create(
+    ) -> Union[ChatCompletion, CompletionResult, Dict[str, Any]]:
+        """
+        Async counterpart of chat_completion.
+
+        With `hedge_percentile` set (e.g. 95), a duplicate request is sent once
+        the call has been outstanding longer than that percentile of this
+        model's recent latencies. Hedging starts after `hedge_min_samples`
+        samples and never applies to streaming requests.
+        """
+        models = self._route(model, latency_budget, stream)
+        for attempt, model in enumerate(models):
+            try:
+                return await self._async_chat_completion(
+                    messages, model, temperature, max_tokens, stream, hedge_percentile, hedge_min_samples, kwargs
+                )
+            except DeepSeekAPIError:
+                if attempt + 1 == len(models):
+                    raise
+
+    async def _async_chat_completion(
+            self,
+            messages: List[Dict[str, str]],
+            model: str,
+            temperature: float,
+            max_tokens: Optional[int],
+            stream: bool,
+            hedge_percentile: Optional[float],
+            hedge_min_samples: int,
+            kwargs: Dict
+    ) -> Union[ChatCompletion, CompletionResult, Dict[str, Any]]:
+        if self.preflight is not None:
+            messages, max_tokens = self.preflight.apply(model, messages, max_tokens)
+        with self._observe(model, stream) as call:
+            key = self._cache_key(model, messages, temperature, max_tokens, stream, kwargs)
+            if key is not None:
+                cached = self.cache.get(key, raw=self.result_type != "completion")
+                if cached is not None:
+                    call.cached = True
+                    call.record_usage(_field(cached, "usage"))
+                    return self._result(cached)
+            if hedge_percentile is not None and not stream:
+                create = functools.partial(self._hedged_acreate, hedge_percentile, hedge_min_samples)
+            else:
+                create = self._acreate
+            create = functools.partial(
+                create,
+                call,
                 model=model,
                 messages=messages,
                 temperature=temperature,
@@ -71,8 +2740,127 @@ class DeepSeekClient:
                 stream=stream,
                 **kwargs
             )
-        except Exception as e:
-            raise DeepSeekAPIError(f"API Error: {str(e)}") from e
+            if self.single_flight is not None and not stream:
+                flight_key = key or cache_key(model, messages, temperature=temperature, max_tokens=max_tokens, **kwargs)
+                response = await self.single_flight.do_async(flight_key, create)
+            else:
+                response = await create()
+            if key is not None:
+                self.cache.set(key, response)
+            return self._result(response)
+
+    async def batch_chat_completion(
+            self,
+            message_lists: List[List[Dict[str, str]]],
+            concurrency: int = 8,
+            model: Optional[str] = None,
+            temperature: float = 0.7,
+            max_tokens: Optional[int] = None,
+            **kwargs
+    ) -> List[Union[ChatCompletion, DeepSeekError]]:
+        """
+        Run async_chat_completion over every message list with at most
+        `concurrency` requests in flight.
+
+        Results are returned in input order. A failed item is returned as its
+        DeepSeekError instead of raising, so one failure does not lose the batch.
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        results: List[Union[ChatCompletion, DeepSeekError]] = [None] * len(message_lists)
+        pending = iter(enumerate(message_lists))
+
+        async def worker():
+            for index, messages in pending:
+                try:
+                    results[index] = await self.async_chat_completion(
+                        messages,
+                        model=model,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        **kwargs
+                    )
+                except DeepSeekError as e:
+                    results[index] = e
+
+        await asyncio.gather(*(worker() for _ in range(min(concurrency, len(message_lists)))))
+        return results
+
+    def map_chat_completion(
+            self,
+            message_lists: Iterable[List[Dict[str, str]]],
+            max_workers: int = 8,
+            max_in_flight: Optional[int] = None,
+            model: Optional[str] = None,
+            temperature: float = 0.7,
+            max_tokens: Optional[int] = None,
+            **kwargs
+    ) -> Iterator[Union[ChatCompletion, DeepSeekError]]:
+        """
+        Run chat_completion over `message_lists` on a thread pool and yield the
+        results in input order, each as soon as it and all earlier ones are done.
+
+        At most `max_in_flight` inputs (default `2 * max_workers`) are submitted
+        or waiting to be yielded at once, so `message_lists` may be a lazy
+        iterable of any length. Every worker shares this client's pooled sync
+        connection. A failed item is yielded as its DeepSeekError.
+        """
+        params = dict(model=model, temperature=temperature, max_tokens=max_tokens, **kwargs)
+        buffered: Dict[int, Union[ChatCompletion, DeepSeekError]] = {}
+        next_index = 0
+        for index, result in self._map_chat_completion(message_lists, max_workers, max_in_flight, buffered, params):
+            buffered[index] = result
+            while next_index in buffered:
+                yield buffered.pop(next_index)
+                next_index += 1
+
+    def map_chat_completion_unordered(
+            self,
+            message_lists: Iterable[List[Dict[str, str]]],
+            max_workers: int = 8,
+            max_in_flight: Optional[int] = None,
+            model: Optional[str] = None,
+            temperature: float = 0.7,
+            max_tokens: Optional[int] = None,
+            **kwargs
+    ) -> Iterator[Tuple[int, Union[ChatCompletion, DeepSeekError]]]:
+        """Like map_chat_completion, but yield `(index, result)` pairs in completion order."""
+        params = dict(model=model, temperature=temperature, max_tokens=max_tokens, **kwargs)
+        return self._map_chat_completion(message_lists, max_workers, max_in_flight, {}, params)
+
+    def _map_chat_completion(
+            self,
+            message_lists: Iterable[List[Dict[str, str]]],
+            max_workers: int,
+            max_in_flight: Optional[int],
+            buffered: Dict,
+            params: Dict
+    ) -> Iterator[Tuple[int, Union[ChatCompletion, DeepSeekError]]]:
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        max_in_flight = max(max_in_flight or 2 * max_workers, 1)
+        pending = iter(enumerate(message_lists))
+        in_flight: Dict = {}
+
+        def call(messages):
+            try:
+                return self.chat_completion(messages, **params)
+            except DeepSeekError as e:
+                return e
+
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="deepseek")
+        try:
+            while True:
+                room = max_in_flight - len(in_flight) - len(buffered)
+                for index, messages in itertools.islice(pending, max(room, 0)):
+                    in_flight[executor.submit(call, messages)] = index
+                if not in_flight:
+                    return
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield in_flight.pop(future), future.result()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
 
     def stream_response(
             self,
@@ -80,11 +2868,42 @@ class DeepSeekClient:
             model: Optional[str] = None,
             temperature: float = 0.7,
             max_tokens: Optional[int] = None,
+            assembler: Optional[StreamAssembler] = None,
+            latency_budget: Optional[float] = None,
+            deadline: Optional[float] = None,
+            cancel: Optional[CancellationToken] = None,
+            stop_pattern: Union[str, re.Pattern, None] = None,
+            stop_after_tokens: Optional[int] = None,
+            deltas: bool = False,
             **kwargs
-    ) -> Generator[ChatCompletionChunk, None, None]:
-        model = model or self.default_model
-        try:
-            stream = self.client.chat.completions.create(
+    ) -> Generator[Union[ChatCompletionChunk, StreamDelta], None, None]:
+        """
+        Yield the chunks of a streamed completion. If an `assembler` is given,
+        every chunk is also fed to it so the final message and timings are
+        available once the stream ends. Without a `model`, a router picks one
+        whose time to first byte fits `latency_budget`.
+
+        The stream ends early, and its HTTP response is closed at once, when
+        `deadline` seconds have passed, `cancel` is cancelled, the content
+        matches `stop_pattern`, or about `stop_after_tokens` tokens (counted
+        client-side) have arrived. An early stop is not an error.
+
+        With `deltas`, the SSE bytes are decoded directly into StreamDelta
+        objects (see SSEDeltaDecoder) instead of ChatCompletionChunk models,
+        which is much cheaper per token.
+        """
+        model = self._route(model, latency_budget, stream=True)[0]
+        if self.preflight is not None:
+            messages, max_tokens = self.preflight.apply(model, messages, max_tokens)
+        stop = _StreamStop(deadline, cancel, stop_pattern, stop_after_tokens)
+        if deadline is not None:
+            kwargs.setdefault("timeout", deadline)
+        if assembler is not None:
+            assembler.start()
+        with self._observe(model, True) as call:
+            stream = self._create(
+                call,
+                raw_stream=deltas,
                 model=model,
                 messages=messages,
                 temperature=temperature,
@@ -92,10 +2911,56 @@ class DeepSeekClient:
                 stream=True,
                 **kwargs
             )
-            for chunk in stream:
-                yield chunk
-        except Exception as e:
-            raise DeepSeekAPIError(f"API Error: {str(e)}") from e
+            disarm = stop.arm(functools.partial(_abort_stream, stream)) if stop.active else None
+            try:
+                for chunk in (_iter_deltas(stream) if deltas else stream):
+                    if stop.reason is not None:
+                        break
+                    if chunk.usage is not None:
+                        call.record_usage(chunk.usage)
+                    if assembler is not None:
+                        assembler.add(chunk)
+                    stopping = stop.active and stop.update(chunk)
+                    yield chunk
+                    if stopping:
+                        break
+            except Exception as e:
+                if stop.reason is None:
+                    raise DeepSeekAPIError(f"API Error: {str(e)}") from e
+            finally:
+                if disarm is not None:
+                    disarm()
+                stream.close()
+                self._settle_stream(call, assembler)
+                if stop.reason is not None:
+                    logger.debug("Stream from %s stopped early: %s", model, stop.reason)
+                if assembler is not None:
+                    assembler.finish()
+
+    def fanout_stream(
+            self,
+            messages: List[Dict[str, str]],
+            model: Optional[str] = None,
+            temperature: float = 0.7,
+            max_tokens: Optional[int] = None,
+            **kwargs
+    ) -> StreamFanout:
+        """
+        Prepare one async_stream_response to be shared by several consumers:
+
+            fanout = client.fanout_stream(messages)
+            websocket = fanout.subscribe(maxsize=32)
+            audit_log = fanout.subscribe(policy="drop")
+            await asyncio.gather(fanout.run(), send(websocket), log(audit_log))
+
+        Each consumer should iterate its subscription inside `async with`.
+        gather does not cancel the other awaitables when one raises, so to stop
+        the upstream request at once on failure, run them in an
+        asyncio.TaskGroup or cancel the run() task yourself.
+        """
+        return StreamFanout(self.async_stream_response(
+            messages, model=model, temperature=temperature, max_tokens=max_tokens, **kwargs
+        ))
 
     async def async_stream_response(
             self,
@@ -103,19 +2968,133 @@ class DeepSeekClient:
             model: Optional[str] = None,
             temperature: float = 0.7,
             max_tokens: Optional[int] = None,
+            assembler: Optional[StreamAssembler] = None,
+            latency_budget: Optional[float] = None,
+            deadline: Optional[float] = None,
+            cancel: Optional[CancellationToken] = None,
+            stop_pattern: Union[str, re.Pattern, None] = None,
+            stop_after_tokens: Optional[int] = None,
+            deltas: bool = False,
             **kwargs
-    ) -> AsyncGenerator[ChatCompletionChunk, None]:
-        model = model or self.default_model
+    ) -> AsyncGenerator[Union[ChatCompletionChunk, StreamDelta], None]:
+        """
+        Async counterpart of stream_response. A deadline or cancellation
+        interrupts a pending read (or the request itself) rather than waiting
+        for the next chunk.
+        """
+        model = self._route(model, latency_budget, stream=True)[0]
+        if self.preflight is not None:
+            messages, max_tokens = self.preflight.apply(model, messages, max_tokens)
+        stop = _StreamStop(deadline, cancel, stop_pattern, stop_after_tokens)
+        if assembler is not None:
+            assembler.start()
+        task = asyncio.current_task()
+        reading = False
+
+        def interrupt():
+            # Only cancel while this generator is awaiting the API, never the consumer's own code
+            if reading:
+                task.cancel()
+
+        disarm = stop.arm_async(interrupt) if stop.active else None
+        stream = None
+        with self._observe(model, True) as call:
+            try:
+                if stop.reason is None:
+                    reading = True
+                    stream = await self._acreate(
+                        call,
+                        raw_stream=deltas,
+                        model=model,
+                        messages=messages,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        stream=True,
+                        **kwargs
+                    )
+                    chunks = _aiter_deltas(stream) if deltas else stream.__aiter__()
+                while stream is not None and stop.reason is None:
+                    reading = True
+                    try:
+                        chunk = await chunks.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    reading = False
+                    if chunk.usage is not None:
+                        call.record_usage(chunk.usage)
+                    if assembler is not None:
+                        assembler.add(chunk)
+                    stopping = stop.active and stop.update(chunk)
+                    yield chunk
+                    if stopping:
+                        break
+            except asyncio.CancelledError:
+                if stop.reason is None or not reading:
+                    raise
+                # The cancellation was ours; withdraw it so the consumer's task carries on
+                if hasattr(task, "uncancel"):
+                    task.uncancel()
+            except Exception as e:
+                if stop.reason is None:
+                    raise DeepSeekAPIError(f"API Error: {str(e)}") from e
+            finally:
+                reading = False
+                if disarm is not None:
+                    disarm()
+                if stream is not None:
+                    await (stream.aclose() if deltas else stream.close())
+                self._settle_stream(call, assembler)
+                if stop.reason is not None:
+                    logger.debug("Stream from %s stopped early: %s", model, stop.reason)
+                if assembler is not None:
+                    assembler.finish()
+
+    def stream_json(
+            self,
+            messages: List[Dict[str, str]],
+            model: Optional[str] = None,
+            temperature: float = 0.7,
+            max_tokens: Optional[int] = None,
+            max_depth: Optional[int] = None,
+            **kwargs
+    ) -> Generator[Tuple[tuple, Any], None, None]:
+        """
+        Stream a JSON-mode completion and yield `(path, value)` for each field
+        and array element as soon as it closes, then `((), document)` at the
+        end (see JSONStreamParser). Other arguments go to stream_response.
+        """
+        kwargs.setdefault("response_format", {"type": "json_object"})
+        parser = JSONStreamParser(max_depth)
         try:
-            stream = await self.async_client.chat.completions.create(
-                model=model,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                stream=True,
-                **kwargs
-            )
-            async for chunk in stream:
-                yield chunk
-        except Exception as e:
-            raise DeepSeekAPIError(f"API Error: {str(e)}") from e
\ No newline at end of file
+            for delta in self.stream_response(
+                messages, model=model, temperature=temperature, max_tokens=max_tokens, deltas=True, **kwargs
+            ):
+                if delta.content:
+                    yield from parser.feed(delta.content)
+            yield from parser.close()
+        except ValueError as e:
+            raise DeepSeekAPIError(f"Invalid JSON in response: {str(e)}") from e
+
+    async def async_stream_json(
+            self,
+            messages: List[Dict[str, str]],
+            model: Optional[str] = None,
+            temperature: float = 0.7,
+            max_tokens: Optional[int] = None,
+            max_depth: Optional[int] = None,
+            **kwargs
+    ) -> AsyncGenerator[Tuple[tuple, Any], None]:
+        """Async counterpart of stream_json."""
+        kwargs.setdefault("response_format", {"type": "json_object"})
+        parser = JSONStreamParser(max_depth)
+        try:
+            async for delta in self.async_stream_response(
+                messages, model=model, temperature=temperature, max_tokens=max_tokens, deltas=True, **kwargs
+            ):
+                if delta.content:
+                    for event in parser.feed(delta.content):
+                        yield event
+            for event in parser.close():
+                yield event
+        except ValueError as e:
+            raise DeepSeekAPIError(f"Invalid JSON in response: {str(e)}") from e
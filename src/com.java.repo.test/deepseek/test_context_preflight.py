@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+ContextPreflight tests with the heuristic token counter; no network or API key needed.
+
+Usage:
+    python test_context_preflight.py
+    python -m pytest test_context_preflight.py
+"""
+
+import unittest
+
+from test import ContextPreflight, DeepSeekContextError
+
+MODEL = "deepseek-chat"
+
+
+def preflight(window, max_output=None, min_output=16, default_output=None):
+    return ContextPreflight(
+        context_windows={MODEL: window},
+        max_output_tokens={MODEL: max_output or window},
+        min_output_tokens=min_output,
+        default_output_tokens={MODEL: default_output or window},
+    )
+
+
+def text(tokens):
+    """ASCII content the heuristic counter puts at exactly `tokens` tokens."""
+    return "x" * (tokens * 10 // 3)
+
+
+def tool_call(*ids):
+    return {
+        "role": "assistant",
+        "content": None,
+        "tool_calls": [
+            {"id": call_id, "type": "function", "function": {"name": "weather", "arguments": "{}"}}
+            for call_id in ids
+        ],
+    }
+
+
+def tool_result(call_id, tokens):
+    return {"role": "tool", "tool_call_id": call_id, "content": text(tokens)}
+
+
+def roles(messages):
+    return [message["role"] for message in messages]
+
+
+class ContextPreflightTest(unittest.TestCase):
+
+    def test_fitting_request_is_unchanged(self):
+        messages = [{"role": "user", "content": "hi"}]
+        self.assertEqual(preflight(1000).apply(MODEL, messages, 100), (messages, 100))
+
+    def test_unknown_model_is_unchanged(self):
+        messages = [{"role": "user", "content": text(5000)}]
+        self.assertEqual(preflight(100).apply("other-model", messages), (messages, None))
+
+    def test_drops_oldest_turns_but_keeps_system_and_last(self):
+        messages = [
+            {"role": "system", "content": "be brief"},
+            {"role": "user", "content": text(60)},
+            {"role": "assistant", "content": text(60)},
+            {"role": "user", "content": text(20)},
+        ]
+        kept, _ = preflight(140).apply(MODEL, messages, 32)
+        self.assertEqual(kept, [messages[0], messages[2], messages[3]])
+        kept, _ = preflight(80).apply(MODEL, messages, 32)
+        self.assertEqual(kept, [messages[0], messages[3]])
+
+    def test_drops_tool_call_with_its_results(self):
+        messages = [
+            {"role": "user", "content": text(20)},
+            tool_call("c1", "c2"),
+            tool_result("c1", 40),
+            tool_result("c2", 40),
+            {"role": "assistant", "content": text(10)},
+            {"role": "user", "content": text(10)},
+        ]
+        kept, _ = preflight(100).apply(MODEL, messages, 32)
+        self.assertEqual(roles(kept), ["assistant", "user"])
+        self.assertNotIn("tool", roles(kept))
+
+    def test_final_tool_result_keeps_its_tool_call(self):
+        messages = [
+            {"role": "system", "content": "be brief"},
+            {"role": "user", "content": text(20)},
+            tool_call("c1", "c2"),
+            tool_result("c1", 90),
+            tool_result("c2", 90),
+        ]
+        kept, max_tokens = preflight(200).apply(MODEL, messages)
+        self.assertEqual(roles(kept), ["system", "assistant", "tool", "tool"])
+        self.assertEqual(kept[:3], [messages[0]] + messages[2:4])
+        self.assertTrue(messages[4]["content"].endswith(kept[3]["content"]))
+        self.assertGreater(max_tokens, 0)
+
+    def test_truncates_last_message_from_the_front(self):
+        content = "a" * 300 + "b" * 300
+        kept, _ = preflight(120).apply(MODEL, [{"role": "user", "content": content}], 16)
+        self.assertTrue(content.endswith(kept[0]["content"]))
+        self.assertLess(len(kept[0]["content"]), len(content))
+        self.assertLessEqual(preflight(120).count(kept), 120 - 16)
+
+    def test_clamps_max_tokens_to_room_left(self):
+        messages = [{"role": "user", "content": text(50)}]
+        _, max_tokens = preflight(200, max_output=100).apply(MODEL, messages, 500)
+        self.assertEqual(max_tokens, 100)
+        _, max_tokens = preflight(200).apply(MODEL, messages, 500)
+        self.assertEqual(max_tokens, 200 - preflight(200).count(messages))
+
+    def test_unset_max_tokens_stays_unset_when_default_fits(self):
+        messages = [{"role": "user", "content": "hi"}]
+        self.assertIsNone(preflight(1000, default_output=100).apply(MODEL, messages)[1])
+        self.assertEqual(preflight(1000, default_output=5000).apply(MODEL, messages)[1],
+                         1000 - preflight(1000).count(messages))
+
+    def test_raises_when_nothing_can_fit(self):
+        messages = [{"role": "system", "content": text(500)}, {"role": "user", "content": "hi"}]
+        with self.assertRaises(DeepSeekContextError):
+            preflight(100).apply(MODEL, messages)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Conversation eviction tests with the heuristic token counter; no network or API key needed.
+
+Usage:
+    python test_conversation.py
+    python -m pytest test_conversation.py
+"""
+
+import unittest
+
+from test import Conversation
+
+TOOL_CALLS = [{"id": "c1", "type": "function", "function": {"name": "weather", "arguments": "{}"}}]
+
+
+def roles(conversation):
+    return [message["role"] for message in conversation.to_messages()]
+
+
+class ConversationEvictionTest(unittest.TestCase):
+
+    def test_sliding_window_keeps_system_prompt(self):
+        conversation = Conversation(system="be brief", max_tokens=40)
+        for i in range(10):
+            conversation.add_user(f"question {i} " + "x" * 20)
+        self.assertEqual(roles(conversation)[0], "system")
+        self.assertLessEqual(conversation.tokens, 40)
+        self.assertEqual(conversation.tokens, conversation.counter.count_messages(conversation.to_messages()))
+
+    def test_trailing_tool_result_keeps_its_tool_call(self):
+        conversation = Conversation(max_tokens=60)
+        conversation.add_user("hello")
+        conversation.add("assistant", None, TOOL_CALLS)
+        conversation.add("tool", "x" * 200, tool_call_id="c1")
+        self.assertEqual(roles(conversation), ["assistant", "tool"])
+
+    def test_tool_call_is_evicted_with_its_results(self):
+        conversation = Conversation(max_tokens=60)
+        conversation.add("assistant", None, TOOL_CALLS)
+        conversation.add("tool", "x" * 200, tool_call_id="c1")
+        conversation.add_user("next")
+        self.assertEqual(roles(conversation), ["user"])
+        self.assertEqual(conversation.tokens, conversation.counter.count_messages(conversation.to_messages()))
+
+    def test_summarizer_folds_evicted_turns(self):
+        calls = []
+
+        def summarizer(previous, evicted):
+            calls.append((previous, [message["role"] for message in evicted]))
+            return "earlier turns"
+
+        conversation = Conversation(system="be brief", max_tokens=60, summarizer=summarizer)
+        conversation.add_user("x" * 60)
+        conversation.add("assistant", None, TOOL_CALLS)
+        conversation.add("tool", "x" * 60, tool_call_id="c1")
+        conversation.add_user("x" * 60)
+        self.assertEqual(calls[-1][1][-2:], ["assistant", "tool"])
+        self.assertEqual(roles(conversation), ["system", "system", "user"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Hedged-request tests against the local fake endpoint; no network or API key needed.
+
+Usage:
+    python test_hedging.py
+    python -m pytest test_hedging.py
+"""
+
+import asyncio
+import time
+import unittest
+
+from fake_server import FakeDeepSeekServer
+from test import DeepSeekClient, LatencyTracker, RateLimiter
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+MODEL = "deepseek-chat"
+
+
+class HedgingTest(unittest.TestCase):
+
+    def setUp(self):
+        # Every request takes 0.3 s, while the recorded history says 0.05 s
+        self.server = FakeDeepSeekServer(latency="constant:0.3")
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        self.tracker = LatencyTracker()
+        for _ in range(20):
+            self.tracker.record(MODEL, 0.05)
+        self.client = DeepSeekClient(api_key="local", base_url=self.server.base_url, latency_tracker=self.tracker)
+
+    def complete(self, **kwargs):
+        """Run one call on a warm client; return the response, its duration and the requests it sent."""
+        async def main():
+            # Builds this loop's SDK client, which would otherwise stall the first attempt
+            await self.client.async_chat_completion(MESSAGES)
+            sent = self.server.stats["requests"]
+            started = time.perf_counter()
+            response = await self.client.async_chat_completion(MESSAGES, **kwargs)
+            return response, time.perf_counter() - started, self.server.stats["requests"] - sent
+
+        return asyncio.run(main())
+
+    def test_slow_call_is_hedged(self):
+        response, elapsed, requests = self.complete(hedge_percentile=95)
+        self.assertEqual(response.choices[0].finish_reason, "stop")
+        self.assertEqual(requests, 2)
+        # The first request wins; the duplicate does not add to the latency
+        self.assertLess(elapsed, 0.3 + 0.05 + 0.2)
+
+    def test_no_hedge_without_enough_samples(self):
+        self.assertEqual(self.complete(hedge_percentile=95, hedge_min_samples=50)[2], 1)
+
+    def test_no_hedge_when_not_requested(self):
+        self.assertEqual(self.complete()[2], 1)
+
+    def test_no_hedge_when_the_call_is_fast_enough(self):
+        for _ in range(40):
+            self.tracker.record(MODEL, 1.0)
+        self.assertEqual(self.complete(hedge_percentile=50)[2], 1)
+
+    def test_losing_hedge_is_refunded(self):
+        # Both attempts reserve about 5000 of the 20000 tokens; only the winner's usage stays charged
+        self.client.rate_limiter = limiter = RateLimiter(tokens_per_minute=20_000)
+        self.assertEqual(self.complete(hedge_percentile=95, max_tokens=5000)[2], 2)
+        self.assertLess(limiter.utilization(), 0.05)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+JSONStreamParser tests; no network or API key needed.
+
+Usage:
+    python test_json_stream_parser.py
+    python -m pytest test_json_stream_parser.py
+"""
+
+import json
+import unittest
+
+from test import JSONStreamParser
+
+DOCUMENT = {
+    "title": "café \"quoted\" \\ line\nbreak \U0001F600",
+    "count": -12.5e3,
+    "flags": [True, False, None],
+    "items": [{"id": 1, "tags": ["a", "b"]}, {"id": 2, "tags": []}],
+    "empty": {},
+}
+
+
+def parse(fragments, max_depth=None):
+    parser = JSONStreamParser(max_depth=max_depth)
+    events = []
+    for fragment in fragments:
+        events.extend(parser.feed(fragment))
+    events.extend(parser.close())
+    return parser, events
+
+
+class JSONStreamParserTest(unittest.TestCase):
+
+    def test_any_split_gives_the_same_document(self):
+        text = json.dumps(DOCUMENT, indent=1)
+        whole, expected = parse([text])
+        self.assertEqual(whole.value, DOCUMENT)
+        for size in (1, 2, 3, 7):
+            with self.subTest(size=size):
+                parser, events = parse([text[i:i + size] for i in range(0, len(text), size)])
+                self.assertEqual(parser.value, DOCUMENT)
+                self.assertEqual(events, expected)
+
+    def test_nested_paths(self):
+        _, events = parse(['{"items": [{"id": 1, "tags": ["a"]}], "n": 2}'])
+        self.assertEqual([path for path, _ in events], [
+            ("items", 0, "id"),
+            ("items", 0, "tags", 0),
+            ("items", 0, "tags"),
+            ("items", 0),
+            ("items",),
+            ("n",),
+            (),
+        ])
+        self.assertEqual(dict(events)[("items", 0, "tags")], ["a"])
+
+    def test_values_are_reported_as_soon_as_they_close(self):
+        parser = JSONStreamParser()
+        self.assertEqual(parser.feed('{"a": "x", "b": [1'), [(("a",), "x")])
+        self.assertEqual(parser.feed(", 2"), [(("b", 0), 1)])
+        self.assertEqual(parser.feed("]"), [(("b", 1), 2), (("b",), [1, 2])])
+        self.assertFalse(parser.done)
+        self.assertEqual(parser.feed("}"), [((), {"a": "x", "b": [1, 2]})])
+        self.assertTrue(parser.done)
+
+    def test_escapes_split_across_feeds(self):
+        for fragments in (
+            ['{"k": "a\\', 'nb\\', '"c\\u00', 'e9\\\\"}'],
+            ['{"k\\', 'u0041": "a\\nb\\"c\\u00e9\\', '\\"}'],
+        ):
+            with self.subTest(fragments=fragments):
+                parser, _ = parse(fragments)
+                self.assertEqual(parser.value, json.loads("".join(fragments)))
+
+    def test_max_depth(self):
+        _, events = parse(['{"a": {"b": [1, 2]}, "c": 3}'], max_depth=1)
+        self.assertEqual([path for path, _ in events], [("a",), ("c",), ()])
+
+    def test_top_level_scalar(self):
+        parser = JSONStreamParser()
+        self.assertEqual(parser.feed("  4"), [])
+        self.assertEqual(parser.feed("2"), [])
+        self.assertEqual(parser.close(), [((), 42)])
+
+    def test_rejects_malformed_input(self):
+        for text in ('{"a" 1}', "[1,]", "[1 2]", '{"a": 1,}', "{1: 2}", '{"a": 1}}', "]", "tru", "x"):
+            with self.subTest(text=text):
+                with self.assertRaises(ValueError):
+                    parse([text])
+
+    def test_rejects_incomplete_document(self):
+        for text in ("", '{"a": [1, 2]', '"open'):
+            with self.subTest(text=text):
+                with self.assertRaises(ValueError):
+                    parse([text])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+KeyPool failover tests against the local fake endpoint; no network or API key needed.
+
+Usage:
+    python test_key_pool.py
+    python -m pytest test_key_pool.py
+"""
+
+import asyncio
+import unittest
+
+import openai
+
+from fake_server import FakeDeepSeekServer
+from test import DeepSeekAPIError, DeepSeekClient, KeyPool
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+class KeyPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeDeepSeekServer(rejected_keys={"revoked", "expired"})
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+
+    def client(self, *keys):
+        pool = KeyPool(list(keys))
+        return pool, DeepSeekClient(base_url=self.server.base_url, key_pool=pool, max_retries=3)
+
+    def assert_auth_error(self, call):
+        with self.assertRaises(DeepSeekAPIError) as raised:
+            call()
+        self.assertNotIn("quarantined", str(raised.exception))
+        self.assertIsInstance(raised.exception.__cause__, openai.AuthenticationError)
+
+    def test_rejected_key_fails_over(self):
+        pool, client = self.client("revoked", "good")
+        for _ in range(3):
+            client.chat_completion(MESSAGES)
+        self.assertEqual([key.key for key in pool.keys if key.quarantined_until], ["revoked"])
+        self.assertLessEqual(self.server.stats["unauthorized"], 1)
+
+    def test_only_key_rejected_raises_the_auth_error(self):
+        _, client = self.client("revoked")
+        self.assert_auth_error(lambda: client.chat_completion(MESSAGES))
+        self.assertEqual(self.server.stats["unauthorized"], 1)
+
+    def test_last_key_rejected_raises_the_auth_error(self):
+        pool, client = self.client("revoked", "expired")
+        self.assert_auth_error(lambda: client.chat_completion(MESSAGES))
+        self.assertFalse(pool.available())
+        _, client = self.client("expired", "revoked")
+        self.assert_auth_error(lambda: asyncio.run(client.async_chat_completion(MESSAGES)))
+
+    def test_empty_pool_says_so(self):
+        _, client = self.client("revoked")
+        self.assert_auth_error(lambda: client.chat_completion(MESSAGES))
+        with self.assertRaisesRegex(DeepSeekAPIError, "quarantined"):
+            client.chat_completion(MESSAGES)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+map_chat_completion tests against the local fake endpoint; no network or API key needed.
+
+Usage:
+    python test_map_chat_completion.py
+    python -m pytest test_map_chat_completion.py
+"""
+
+import threading
+import time
+import unittest
+
+from fake_server import FakeDeepSeekServer, count_tokens
+from test import DeepSeekAPIError, DeepSeekClient
+
+ITEMS = 24
+
+
+def messages(i):
+    # The fake server reports prompt_tokens = i + 4, which identifies the item in its response
+    return [{"role": "user", "content": "x" * (4 * i)}]
+
+
+def item_of(response):
+    return response.usage.prompt_tokens - count_tokens(messages(0))
+
+
+class Inputs:
+    """A lazy input stream that counts how many items have been taken from it."""
+
+    def __init__(self, count):
+        self.count = count
+        self.taken = 0
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        for i in range(self.count):
+            with self._lock:
+                self.taken += 1
+            yield messages(i)
+
+
+class MapChatCompletionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeDeepSeekServer(latency="uniform:0,0.05", seed=7)
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        self.client = DeepSeekClient(api_key="local", base_url=self.server.base_url, max_retries=0)
+
+    def test_results_come_back_in_input_order(self):
+        results = list(self.client.map_chat_completion(Inputs(ITEMS), max_workers=8))
+        self.assertEqual([item_of(result) for result in results], list(range(ITEMS)))
+
+    def test_unordered_results_carry_their_index(self):
+        pairs = list(self.client.map_chat_completion_unordered(Inputs(ITEMS), max_workers=8))
+        self.assertEqual(sorted(index for index, _ in pairs), list(range(ITEMS)))
+        for index, result in pairs:
+            self.assertEqual(item_of(result), index)
+
+    def test_in_flight_is_capped_for_a_slow_reader(self):
+        inputs = Inputs(ITEMS)
+        yielded = 0
+        for _ in self.client.map_chat_completion(inputs, max_workers=2, max_in_flight=4):
+            yielded += 1
+            # Taken but not yet yielded: submitted, running or buffered behind an earlier item
+            self.assertLessEqual(inputs.taken - yielded, 4)
+            time.sleep(0.02)
+        self.assertEqual(yielded, ITEMS)
+
+    def test_stopping_early_stops_taking_inputs(self):
+        inputs = Inputs(1000)
+        results = self.client.map_chat_completion(inputs, max_workers=2, max_in_flight=4)
+        for _ in zip(range(3), results):
+            pass
+        results.close()
+        self.assertLessEqual(inputs.taken, 3 + 4)
+
+    def test_failures_are_yielded_in_place(self):
+        self.server.error_rate = 1.0
+        results = list(self.client.map_chat_completion(Inputs(4), max_workers=2))
+        self.assertEqual(len(results), 4)
+        for result in results:
+            self.assertIsInstance(result, DeepSeekAPIError)
+
+    def test_rejects_no_workers(self):
+        with self.assertRaises(ValueError):
+            list(self.client.map_chat_completion([messages(0)], max_workers=0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+ModelRouter tests against a frozen clock and the local fake endpoint; no
+network or API key needed.
+
+Usage:
+    python test_model_router.py
+    python -m pytest test_model_router.py
+"""
+
+import unittest
+from unittest import mock
+
+from fake_server import FakeDeepSeekServer
+from test import CallMetrics, DeepSeekClient, DeepSeekError, ModelRouter
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+FAST, SLOW = "deepseek-chat", "deepseek-reasoner"
+
+
+def call(model, latency=None, error=None):
+    metrics = CallMetrics(model)
+    metrics.latency = latency
+    metrics.error = error
+    return metrics
+
+
+class ModelRouterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.router = ModelRouter(models=(SLOW, FAST), min_samples=3, max_age=60)
+
+    def test_preference_order_without_budget(self):
+        self.assertEqual(self.router.rank(), [SLOW, FAST])
+        self.assertEqual(self.router.rank(prefer=FAST), [FAST, SLOW])
+
+    def test_budget_beats_preference(self):
+        for _ in range(3):
+            self.router.on_call(call(SLOW, latency=5.0))
+            self.router.on_call(call(FAST, latency=0.5))
+        self.assertEqual(self.router.rank(1.0, prefer=SLOW), [FAST, SLOW])
+
+    def test_degraded_model_goes_last(self):
+        for _ in range(3):
+            self.router.on_call(call(FAST, error=DeepSeekError("boom")))
+        self.assertTrue(self.router.degraded(FAST))
+        self.assertEqual(self.router.rank(prefer=FAST), [SLOW, FAST])
+        self.now += self.router.cooldown
+        self.assertEqual(self.router.rank(prefer=FAST), [FAST, SLOW])
+
+    def test_slow_model_is_retried_once_its_samples_age_out(self):
+        for _ in range(3):
+            self.router.on_call(call(SLOW, latency=5.0))
+        self.assertEqual(self.router.rank(1.0), [FAST, SLOW])
+        self.now += 30
+        self.assertEqual(self.router.rank(1.0), [FAST, SLOW])
+        self.now += 31
+        self.assertIsNone(self.router.estimate(SLOW))
+        self.assertEqual(self.router.rank(1.0), [SLOW, FAST])
+
+
+class ClientRoutingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeDeepSeekServer(completion_tokens=16)
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        self.router = ModelRouter()
+        self.client = DeepSeekClient(api_key="local", base_url=self.server.base_url, router=self.router)
+
+    def test_default_model_leads_without_budget(self):
+        response = self.client.chat_completion(MESSAGES)
+        self.assertEqual(response.model, "deepseek-chat")
+        client = DeepSeekClient(
+            api_key="local", base_url=self.server.base_url, default_model="deepseek-reasoner", router=ModelRouter()
+        )
+        self.assertEqual(client.chat_completion(MESSAGES).model, "deepseek-reasoner")
+
+    def test_abandoned_streams_do_not_degrade_a_model(self):
+        for _ in range(12):
+            stream = self.client.stream_response(MESSAGES)
+            for i, _ in enumerate(stream):
+                if i == 3:
+                    break
+            stream.close()
+        self.assertFalse(self.router.degraded("deepseek-chat"))
+        self.assertEqual(self.router.error_rate("deepseek-chat"), 0.0)
+        self.assertEqual(self.client.chat_completion(MESSAGES).model, "deepseek-chat")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Observer hook tests against the local fake endpoint; no network or API key needed.
+
+Usage:
+    python test_observers.py
+    python -m pytest test_observers.py
+"""
+
+import asyncio
+import unittest
+
+from fake_server import FakeDeepSeekServer
+from test import DeepSeekClient, HistogramAggregator, Observer, StreamFanout
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+class Recorder(Observer):
+
+    def __init__(self):
+        self.calls = []
+
+    def on_call(self, call):
+        self.calls.append(call)
+
+
+class ObserverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeDeepSeekServer(completion_tokens=16)
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        self.recorder = Recorder()
+        self.histogram = HistogramAggregator()
+        self.client = DeepSeekClient(
+            api_key="local", base_url=self.server.base_url, observers=[self.recorder, self.histogram]
+        )
+
+    def assert_no_errors(self, count):
+        self.assertEqual(len(self.recorder.calls), count)
+        self.assertEqual([call.error for call in self.recorder.calls], [None] * count)
+        self.assertNotIn("errors", self.histogram.snapshot()["counters"])
+
+    def test_records_completed_calls(self):
+        self.client.chat_completion(MESSAGES)
+        list(self.client.stream_response(MESSAGES))
+        self.assert_no_errors(2)
+        self.assertEqual(self.recorder.calls[0].completion_tokens, 16)
+
+    def test_abandoned_stream_is_not_an_error(self):
+        for deltas in (False, True):
+            stream = self.client.stream_response(MESSAGES, deltas=deltas)
+            for i, _ in enumerate(stream):
+                if i == 3:
+                    break
+            stream.close()
+        self.assert_no_errors(2)
+
+    def test_abandoned_async_stream_is_not_an_error(self):
+        async def abandon():
+            stream = self.client.async_stream_response(MESSAGES)
+            async for _ in stream:
+                break
+            await stream.aclose()
+
+        asyncio.run(abandon())
+        self.assert_no_errors(1)
+
+    def test_fanout_without_subscribers_is_not_an_error(self):
+        async def run():
+            fanout = StreamFanout(self.client.async_stream_response(MESSAGES))
+            subscription = fanout.subscribe(maxsize=1)
+
+            async def consume():
+                async with subscription:
+                    async for _ in subscription:
+                        break
+
+            await asyncio.gather(fanout.run(), consume())
+
+        asyncio.run(run())
+        self.assert_no_errors(1)
+
+
+if __name__ == "__main__":
+    unittest.main()
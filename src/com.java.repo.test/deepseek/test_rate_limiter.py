@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+RateLimiter reservation and settlement tests against a frozen clock; no network
+or API key needed.
+
+Usage:
+    python test_rate_limiter.py
+    python -m pytest test_rate_limiter.py
+"""
+
+import unittest
+from unittest import mock
+
+from test import RateLimiter
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # 600 tokens per minute refill at 10 tokens per second
+        self.limiter = RateLimiter(tokens_per_minute=600)
+
+    def test_waits_out_debt_in_arrival_order(self):
+        self.assertEqual(self.limiter.reserve(600), 0.0)
+        self.assertAlmostEqual(self.limiter.reserve(100), 10.0)
+        self.assertAlmostEqual(self.limiter.reserve(100), 20.0)
+        self.now += 5
+        self.assertAlmostEqual(self.limiter.reserve(50), 20.0)
+
+    def test_refunds_unused_tokens(self):
+        self.limiter.reserve(600)
+        self.limiter.settle(600, 100)
+        self.assertEqual(self.limiter.reserve(500), 0.0)
+        self.assertAlmostEqual(self.limiter.reserve(10), 1.0)
+
+    def test_failed_attempt_refunds_everything(self):
+        self.limiter.reserve(400)
+        self.limiter.settle(400, 0)
+        self.assertEqual(self.limiter.reserve(600), 0.0)
+
+    def test_refund_never_exceeds_capacity(self):
+        self.limiter.reserve(100)
+        self.now += 60
+        self.limiter.settle(100, 0)
+        self.assertEqual(self.limiter.reserve(600), 0.0)
+        self.assertAlmostEqual(self.limiter.reserve(10), 1.0)
+
+    def test_usage_beyond_the_reservation_becomes_debt(self):
+        self.limiter.reserve(100)
+        self.limiter.settle(100, 300)
+        self.assertEqual(self.limiter.reserve(300), 0.0)
+        self.assertAlmostEqual(self.limiter.reserve(100), 10.0)
+
+    def test_reservation_is_clamped_to_capacity(self):
+        # A request larger than the whole bucket still goes through once the bucket is full
+        self.assertEqual(self.limiter.reserve(1000), 0.0)
+        self.assertAlmostEqual(self.limiter.reserve(60), 6.0)
+
+    def test_settle_charges_only_beyond_the_clamped_reservation(self):
+        self.limiter.reserve(1000)
+        self.limiter.settle(1000, 1000)
+        self.assertAlmostEqual(self.limiter.reserve(60), 46.0)
+
+        limiter = RateLimiter(tokens_per_minute=600)
+        limiter.reserve(1000)
+        limiter.settle(1000, 500)
+        self.assertEqual(limiter.reserve(100), 0.0)
+        self.assertAlmostEqual(limiter.reserve(10), 1.0)
+
+    def test_requests_per_minute(self):
+        limiter = RateLimiter(requests_per_minute=60)
+        for _ in range(60):
+            self.assertEqual(limiter.reserve(), 0.0)
+        self.assertAlmostEqual(limiter.reserve(), 1.0)
+        limiter.settle(100, 0)
+        self.assertAlmostEqual(limiter.reserve(), 2.0)
+
+    def test_pause(self):
+        self.limiter.pause(5)
+        self.assertAlmostEqual(self.limiter.reserve(1), 5.0)
+        self.assertEqual(self.limiter.utilization(), 1.0)
+        self.now += 5
+        self.assertEqual(self.limiter.reserve(1), 0.0)
+
+    def test_utilization(self):
+        self.assertEqual(self.limiter.utilization(), 0.0)
+        self.limiter.reserve(300)
+        self.assertAlmostEqual(self.limiter.utilization(), 0.5)
+        self.now += 15
+        self.assertAlmostEqual(self.limiter.utilization(), 0.25)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+ResponseCache tests for the memory and SQLite tiers; no network or API key needed.
+
+Usage:
+    python test_response_cache.py
+    python -m pytest test_response_cache.py
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from test import ResponseCache
+
+
+def response(n, size=0):
+    return {"id": f"chatcmpl-{n}", "choices": [{"message": {"content": "x" * size}}]}
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "cache.sqlite")
+
+    def cache(self, **kwargs):
+        cache = ResponseCache(path=self.path, **kwargs)
+        self.addCleanup(cache.close)
+        return cache
+
+    def disk_keys(self):
+        with sqlite3.connect(self.path) as db:
+            return [key for key, in db.execute("SELECT key FROM responses ORDER BY rowid")]
+
+    def test_round_trip_and_restart(self):
+        cache = self.cache()
+        cache.set("a", response(1))
+        self.assertEqual(cache.get("a", raw=True), response(1))
+        self.assertIsNone(cache.get("b", raw=True))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(self.cache().get("a", raw=True), response(1))
+
+    def test_memory_tier_is_bounded(self):
+        cache = ResponseCache(max_entries=2)
+        for key in "abc":
+            cache.set(key, response(key))
+        self.assertIsNone(cache.get("a", raw=True))
+        self.assertEqual(cache.get("c", raw=True), response("c"))
+
+    def test_disk_tier_keeps_the_newest_rows(self):
+        cache = self.cache(disk_max_entries=10)
+        sets = ResponseCache.PRUNE_INTERVAL
+        for n in range(sets):
+            cache.set(f"k{n}", response(n))
+        # Pruned on the last set, without an explicit prune()
+        self.assertEqual(self.disk_keys(), [f"k{n}" for n in range(sets - 10, sets)])
+
+    def test_rewritten_key_counts_as_newest(self):
+        cache = self.cache(disk_max_entries=2)
+        for key in ("a", "b", "a", "c"):
+            cache.set(key, response(key))
+        cache.prune()
+        self.assertEqual(self.disk_keys(), ["a", "c"])
+
+    def test_disk_tier_is_bounded_in_bytes(self):
+        row_bytes = len(json.dumps(response(0, size=300), separators=(",", ":")))
+        cache = self.cache(disk_max_bytes=3 * row_bytes + row_bytes // 2)
+        for n in range(10):
+            cache.set(f"k{n}", response(n, size=300))
+        cache.prune()
+        self.assertEqual(self.disk_keys(), ["k7", "k8", "k9"])
+
+    def test_expired_rows_are_deleted_on_open(self):
+        with mock.patch("time.time", lambda: 1000.0):
+            cache = self.cache(ttl=10)
+            cache.set("old", response(1))
+        with mock.patch("time.time", lambda: 1005.0):
+            cache.set("new", response(2))
+        cache.close()
+        with mock.patch("time.time", lambda: 1012.0):
+            cache = self.cache(ttl=10)
+            self.assertEqual(self.disk_keys(), ["new"])
+            self.assertEqual(cache.get("new", raw=True), response(2))
+
+
+if __name__ == "__main__":
+    unittest.main()
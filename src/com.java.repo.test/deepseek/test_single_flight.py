@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Single-flight coalescing tests, in process and against the local fake endpoint;
+no network or API key needed.
+
+Usage:
+    python test_single_flight.py
+    python -m pytest test_single_flight.py
+"""
+
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_server import FakeDeepSeekServer
+from test import DeepSeekClient, SingleFlight
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+CALLERS = 6
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def test_threads_share_one_call(self):
+        flight = SingleFlight()
+        calls = []
+        started = threading.Event()
+
+        def work():
+            calls.append(1)
+            started.set()
+            time.sleep(0.1)
+            return object()
+
+        with ThreadPoolExecutor(CALLERS) as executor:
+            leader = executor.submit(flight.do, "k", work)
+            started.wait()
+            followers = [executor.submit(flight.do, "k", work) for _ in range(CALLERS - 1)]
+            results = [leader.result()] + [future.result() for future in followers]
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(result is results[0] for result in results))
+        # The flight is forgotten once it lands
+        flight.do("k", work)
+        self.assertEqual(len(calls), 2)
+
+    def test_threads_share_the_error(self):
+        flight = SingleFlight()
+        started = threading.Event()
+
+        def fail():
+            started.set()
+            time.sleep(0.1)
+            raise ValueError("upstream failed")
+
+        with ThreadPoolExecutor(3) as executor:
+            futures = [executor.submit(flight.do, "k", fail)]
+            started.wait()
+            futures += [executor.submit(flight.do, "k", fail) for _ in range(2)]
+            for future in futures:
+                with self.assertRaisesRegex(ValueError, "upstream failed"):
+                    future.result()
+
+    def test_tasks_share_one_call(self):
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return len(calls)
+
+        async def main():
+            flight = SingleFlight()
+            first = await asyncio.gather(*(flight.do_async("k", work) for _ in range(CALLERS)))
+            second = await flight.do_async("k", work)
+            other = await asyncio.gather(flight.do_async("a", work), flight.do_async("b", work))
+            return first, second, other
+
+        first, second, other = asyncio.run(main())
+        self.assertEqual(first, [1] * CALLERS)
+        self.assertEqual(second, 2)
+        self.assertEqual(len(calls), 4)
+
+    def test_cancelled_caller_does_not_cancel_the_others(self):
+        async def work():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        async def main():
+            flight = SingleFlight()
+            impatient = asyncio.ensure_future(flight.do_async("k", work))
+            patient = asyncio.ensure_future(flight.do_async("k", work))
+            await asyncio.sleep(0.01)
+            impatient.cancel()
+            return await patient
+
+        self.assertEqual(asyncio.run(main()), "done")
+
+
+class ClientSingleFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeDeepSeekServer(latency="constant:0.2")
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        self.client = DeepSeekClient(api_key="local", base_url=self.server.base_url, single_flight=True)
+
+    def test_identical_sync_calls_send_one_request(self):
+        with ThreadPoolExecutor(CALLERS) as executor:
+            results = list(executor.map(lambda _: self.client.chat_completion(MESSAGES), range(CALLERS)))
+        self.assertEqual(self.server.stats["requests"], 1)
+        self.assertEqual(len({result.id for result in results}), 1)
+
+    def test_identical_async_calls_send_one_request(self):
+        async def main():
+            return await asyncio.gather(*(self.client.async_chat_completion(MESSAGES) for _ in range(CALLERS)))
+
+        results = asyncio.run(main())
+        self.assertEqual(self.server.stats["requests"], 1)
+        self.assertEqual(len({result.id for result in results}), 1)
+
+    def test_different_requests_are_not_coalesced(self):
+        async def main():
+            return await asyncio.gather(
+                self.client.async_chat_completion(MESSAGES),
+                self.client.async_chat_completion(MESSAGES, temperature=0.1),
+                self.client.async_chat_completion([{"role": "user", "content": "other"}]),
+            )
+
+        asyncio.run(main())
+        self.assertEqual(self.server.stats["requests"], 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
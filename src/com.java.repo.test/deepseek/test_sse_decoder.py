@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+SSEDeltaDecoder tests on hand-built SSE byte streams; no network or API key needed.
+
+Usage:
+    python test_sse_decoder.py
+    python -m pytest test_sse_decoder.py
+"""
+
+import json
+import unittest
+
+from test import DeepSeekAPIError, SSEDeltaDecoder
+
+
+def chunk(content=None, finish_reason=None, usage=None, choices=True):
+    body = {"id": "chatcmpl-1", "object": "chat.completion.chunk", "model": "deepseek-chat", "choices": []}
+    if choices:
+        body["choices"] = [{"index": 0, "delta": {"content": content}, "finish_reason": finish_reason}]
+    if usage is not None:
+        body["usage"] = usage
+    return body
+
+
+def sse(*bodies, newline=b"\n"):
+    frames = [b"data: " + json.dumps(body).encode() for body in bodies] + [b"data: [DONE]"]
+    return b"".join(frame + newline + newline for frame in frames)
+
+
+USAGE = {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5}
+STREAM = (chunk("Hé"), chunk(" wörld"), chunk(finish_reason="stop"), chunk(usage=USAGE, choices=False))
+
+
+def decode(reads):
+    decoder = SSEDeltaDecoder()
+    deltas = []
+    for data in reads:
+        deltas.extend(decoder.feed(data))
+    return decoder, deltas
+
+
+def summary(deltas):
+    return [(delta.content, delta.finish_reason, delta.usage, delta.model) for delta in deltas]
+
+
+class SSEDeltaDecoderTest(unittest.TestCase):
+
+    def test_decodes_deltas(self):
+        decoder, deltas = decode([sse(*STREAM)])
+        self.assertTrue(decoder.done)
+        self.assertEqual(summary(deltas), [
+            ("Hé", None, None, "deepseek-chat"),
+            (" wörld", None, None, "deepseek-chat"),
+            (None, "stop", None, "deepseek-chat"),
+            (None, None, USAGE, "deepseek-chat"),
+        ])
+
+    def test_any_byte_split_gives_the_same_deltas(self):
+        for newline in (b"\n", b"\r\n"):
+            data = sse(*STREAM, newline=newline)
+            expected = summary(decode([data])[1])
+            for size in (1, 2, 3, 5, 64):
+                with self.subTest(newline=newline, size=size):
+                    decoder, deltas = decode([data[i:i + size] for i in range(0, len(data), size)])
+                    self.assertTrue(decoder.done)
+                    self.assertEqual(summary(deltas), expected)
+
+    def test_crlf_split_across_reads(self):
+        data = sse(chunk("a"), newline=b"\r\n")
+        for cut in [i + 1 for i, byte in enumerate(data) if byte == ord("\r")]:
+            with self.subTest(cut=cut):
+                decoder, deltas = decode([data[:cut], data[cut:]])
+                self.assertTrue(decoder.done)
+                self.assertEqual([delta.content for delta in deltas], ["a"])
+
+    def test_multi_line_data(self):
+        body = json.dumps(chunk("x"), indent=1).encode()
+        frame = b"".join(b"data: " + line + b"\n" for line in body.split(b"\n"))
+        _, deltas = decode([frame + b"\n" + b"data: [DONE]\n\n"])
+        self.assertEqual([delta.content for delta in deltas], ["x"])
+
+    def test_ignores_comments_and_other_fields(self):
+        data = b": keep-alive\n\nevent: message\nid: 1\ndata:" + json.dumps(chunk("y")).encode() + b"\n\n"
+        decoder, deltas = decode([data])
+        self.assertEqual([delta.content for delta in deltas], ["y"])
+        self.assertFalse(decoder.done)
+
+    def test_stops_at_done(self):
+        decoder, deltas = decode([sse(chunk("a")) + sse(chunk("after"))])
+        self.assertTrue(decoder.done)
+        self.assertEqual([delta.content for delta in deltas], ["a"])
+        self.assertEqual(decoder.feed(sse(chunk("later"))), [])
+
+    def test_error_frame_raises(self):
+        data = b'data: {"error": {"message": "overloaded", "code": 503}}\n\n'
+        with self.assertRaisesRegex(DeepSeekAPIError, "overloaded"):
+            decode([data[:10], data[10:]])
+
+
+if __name__ == "__main__":
+    unittest.main()
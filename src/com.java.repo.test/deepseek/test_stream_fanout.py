@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+StreamFanout tests on an in-process chunk source; no network or API key needed.
+
+Usage:
+    python test_stream_fanout.py
+    python -m pytest test_stream_fanout.py
+"""
+
+import asyncio
+import unittest
+
+from test import DeepSeekStreamOverrunError, StreamFanout
+
+CHUNKS = 20
+
+
+class Source:
+    """An async chunk stream that records how far it was read and whether it was closed."""
+
+    def __init__(self, count=CHUNKS):
+        self.count = count
+        self.sent = 0
+        self.closed = False
+
+    async def stream(self):
+        try:
+            for i in range(self.count):
+                self.sent += 1
+                yield i
+                await asyncio.sleep(0)
+        finally:
+            self.closed = True
+
+
+async def collect(subscription, limit=None, delay=0.0):
+    items = []
+    async with subscription:
+        async for item in subscription:
+            items.append(item)
+            if delay:
+                await asyncio.sleep(delay)
+            if limit is not None and len(items) == limit:
+                break
+    return items
+
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, timeout=5))
+
+
+class StreamFanoutTest(unittest.TestCase):
+
+    def test_every_consumer_gets_every_chunk(self):
+        async def main():
+            source = Source()
+            fanout = StreamFanout(source.stream())
+            fast, slow = fanout.subscribe(maxsize=2), fanout.subscribe(maxsize=2)
+            _, a, b = await asyncio.gather(fanout.run(), collect(fast), collect(slow, delay=0.001))
+            return source, a, b
+
+        source, fast, slow = run(main())
+        self.assertEqual(fast, list(range(CHUNKS)))
+        self.assertEqual(slow, list(range(CHUNKS)))
+        self.assertTrue(source.closed)
+
+    def test_source_closes_once_every_subscriber_leaves(self):
+        async def main():
+            source = Source(count=1000)
+            fanout = StreamFanout(source.stream())
+            first, second = fanout.subscribe(maxsize=1), fanout.subscribe(maxsize=1)
+            await asyncio.gather(fanout.run(), collect(first, limit=2), collect(second, limit=5))
+            return source
+
+        source = run(main())
+        self.assertTrue(source.closed)
+        self.assertLess(source.sent, 20)
+
+    def test_dead_block_consumer_does_not_stall_the_stream(self):
+        async def die(subscription):
+            # Fails after one chunk without closing its subscription
+            async for _ in subscription:
+                raise RuntimeError("consumer crashed")
+
+        async def main():
+            source = Source()
+            fanout = StreamFanout(source.stream())
+            dead, alive = fanout.subscribe(maxsize=1), fanout.subscribe(maxsize=1)
+            results = await asyncio.gather(fanout.run(), die(dead), collect(alive), return_exceptions=True)
+            return source, results
+
+        source, (ran, died, items) = run(main())
+        self.assertIsNone(ran)
+        self.assertIsInstance(died, RuntimeError)
+        self.assertEqual(items, list(range(CHUNKS)))
+        self.assertTrue(source.closed)
+
+    def test_drop_policy_skips_chunks_for_a_slow_consumer(self):
+        async def main():
+            fanout = StreamFanout(Source().stream())
+            fast = fanout.subscribe(maxsize=1)
+            slow = fanout.subscribe(maxsize=1, policy="drop")
+            _, items, skipped = await asyncio.gather(fanout.run(), collect(fast), collect(slow, delay=0.01))
+            return items, skipped, slow.dropped
+
+        items, skipped, dropped = run(main())
+        self.assertEqual(items, list(range(CHUNKS)))
+        self.assertGreater(dropped, 0)
+        self.assertEqual(len(skipped) + dropped, CHUNKS)
+
+    def test_disconnect_policy_ends_a_slow_consumer(self):
+        async def main():
+            fanout = StreamFanout(Source().stream())
+            fast = fanout.subscribe(maxsize=1)
+            slow = fanout.subscribe(maxsize=1, policy="disconnect")
+            return await asyncio.gather(
+                fanout.run(), collect(fast), collect(slow, delay=0.01), return_exceptions=True
+            )
+
+        _, items, overrun = run(main())
+        self.assertEqual(items, list(range(CHUNKS)))
+        self.assertIsInstance(overrun, DeepSeekStreamOverrunError)
+
+
+if __name__ == "__main__":
+    unittest.main()
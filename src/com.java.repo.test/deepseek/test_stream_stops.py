@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Stream deadline, cancellation and stop-predicate tests against the local fake
+endpoint; no network or API key needed.
+
+Usage:
+    python test_stream_stops.py
+    python -m pytest test_stream_stops.py
+"""
+
+import asyncio
+import threading
+import time
+import unittest
+
+from fake_server import FakeDeepSeekServer
+from test import CancellationToken, DeepSeekClient, Observer
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+# 200 tokens at 40 per second: a full stream would take five seconds
+TOKENS, TOKENS_PER_SECOND = 200, 40
+
+
+class Recorder(Observer):
+
+    def __init__(self):
+        self.calls = []
+
+    def on_call(self, call):
+        self.calls.append(call)
+
+
+def content(chunks):
+    return "".join(chunk.content or "" for chunk in chunks)
+
+
+class StreamStopTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeDeepSeekServer(completion_tokens=TOKENS, tokens_per_second=TOKENS_PER_SECOND)
+        self.server.__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        self.recorder = Recorder()
+        self.client = DeepSeekClient(api_key="local", base_url=self.server.base_url, observers=[self.recorder])
+
+    def stream(self, use_async, **kwargs):
+        """Read a whole stream of StreamDeltas; return them and how long it took."""
+        started = time.perf_counter()
+        if use_async:
+            async def read():
+                return [delta async for delta in self.client.async_stream_response(MESSAGES, deltas=True, **kwargs)]
+            chunks = asyncio.run(read())
+        else:
+            chunks = list(self.client.stream_response(MESSAGES, deltas=True, **kwargs))
+        return chunks, time.perf_counter() - started
+
+    def assert_stopped_early(self, chunks, elapsed, within):
+        self.assertLess(elapsed, within)
+        self.assertLess(len(chunks), TOKENS)
+        self.assertIsNone(self.recorder.calls[-1].error)
+
+    def test_deadline(self):
+        for use_async in (False, True):
+            with self.subTest(use_async=use_async):
+                chunks, elapsed = self.stream(use_async, deadline=0.5)
+                self.assert_stopped_early(chunks, elapsed, 1.5)
+                self.assertGreater(len(chunks), 0)
+
+    def test_deadline_interrupts_a_pending_read(self):
+        self.server.tokens_per_second = 0.5
+        for use_async in (False, True):
+            with self.subTest(use_async=use_async):
+                chunks, elapsed = self.stream(use_async, deadline=0.5)
+                self.assert_stopped_early(chunks, elapsed, 1.5)
+
+    def test_cancellation_from_another_thread(self):
+        for use_async in (False, True):
+            with self.subTest(use_async=use_async):
+                cancel = CancellationToken()
+                threading.Timer(0.5, cancel.cancel).start()
+                chunks, elapsed = self.stream(use_async, cancel=cancel)
+                self.assert_stopped_early(chunks, elapsed, 1.5)
+
+    def test_already_cancelled_token_sends_nothing(self):
+        cancel = CancellationToken()
+        cancel.cancel()
+        chunks, _ = self.stream(True, cancel=cancel)
+        self.assertEqual(chunks, [])
+        self.assertEqual(self.server.stats["requests"], 0)
+
+    def test_stop_pattern(self):
+        for use_async in (False, True):
+            with self.subTest(use_async=use_async):
+                chunks, elapsed = self.stream(use_async, stop_pattern=r"lazy\s+dog")
+                self.assert_stopped_early(chunks, elapsed, 2.0)
+                self.assertTrue(content(chunks).endswith("lazy dog"))
+
+    def test_stop_after_tokens(self):
+        for use_async in (False, True):
+            with self.subTest(use_async=use_async):
+                chunks, elapsed = self.stream(use_async, stop_after_tokens=10)
+                self.assert_stopped_early(chunks, elapsed, 2.0)
+                self.assertLess(len(chunks), 20)
+
+    def test_consumer_code_is_not_interrupted(self):
+        async def read():
+            chunks = []
+            async for delta in self.client.async_stream_response(MESSAGES, deltas=True, deadline=0.3):
+                chunks.append(delta)
+                # Past the deadline while the consumer, not the stream, is running
+                await asyncio.sleep(0.5)
+                chunks.append("consumer finished")
+            return chunks
+
+        chunks = asyncio.run(read())
+        self.assertEqual(chunks[1], "consumer finished")
+        self.assertIsNone(self.recorder.calls[-1].error)
+
+
+if __name__ == "__main__":
+    unittest.main()
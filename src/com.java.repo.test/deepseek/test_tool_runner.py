@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+ToolRunner tests against a scripted client; no network or API key needed.
+
+Usage:
+    python test_tool_runner.py
+    python -m pytest test_tool_runner.py
+"""
+
+import asyncio
+import json
+import unittest
+
+from test import ToolRunner
+
+
+def tool_call_response(arguments):
+    message = {
+        "role": "assistant",
+        "content": None,
+        "tool_calls": [{
+            "id": "call_1",
+            "type": "function",
+            "function": {"name": "weather", "arguments": arguments},
+        }],
+    }
+    return {"choices": [{"message": message}]}
+
+
+FINAL = {"choices": [{"message": {"role": "assistant", "content": "done"}}]}
+
+
+class ScriptedClient:
+    """Answers with one tool call, then a plain reply; keeps the messages it was sent."""
+
+    def __init__(self, arguments):
+        self.arguments = arguments
+        self.sent = []
+
+    def chat_completion(self, messages, model=None, **kwargs):
+        self.sent.append(list(messages))
+        return tool_call_response(self.arguments) if len(self.sent) == 1 else FINAL
+
+    async def async_chat_completion(self, messages, model=None, **kwargs):
+        return self.chat_completion(messages, model=model, **kwargs)
+
+
+def sync_weather(city):
+    return {"city": city}
+
+
+async def async_weather(city):
+    return {"city": city}
+
+
+class ToolRunnerArgumentsTest(unittest.TestCase):
+
+    def run_tool(self, handler, arguments, use_async):
+        client = ScriptedClient(arguments)
+        runner = ToolRunner(client, timeout=5.0)
+        runner.register(handler, name="weather")
+        if use_async:
+            response = asyncio.run(runner.arun([{"role": "user", "content": "hi"}]))
+        else:
+            response = runner.run([{"role": "user", "content": "hi"}])
+        self.assertIs(response, FINAL)
+        result = client.sent[-1][-1]
+        self.assertEqual(result["role"], "tool")
+        self.assertEqual(result["tool_call_id"], "call_1")
+        return json.loads(result["content"])
+
+    def test_valid_arguments(self):
+        for handler in (sync_weather, async_weather):
+            for use_async in (False, True):
+                with self.subTest(handler=handler.__name__, use_async=use_async):
+                    self.assertEqual(self.run_tool(handler, '{"city": "Oslo"}', use_async), {"city": "Oslo"})
+
+    def test_non_object_arguments(self):
+        for handler in (sync_weather, async_weather):
+            for use_async in (False, True):
+                with self.subTest(handler=handler.__name__, use_async=use_async):
+                    result = self.run_tool(handler, "[1]", use_async)
+                    self.assertIn("expected a JSON object", result["error"])
+
+    def test_unexpected_keys(self):
+        for handler in (sync_weather, async_weather):
+            for use_async in (False, True):
+                with self.subTest(handler=handler.__name__, use_async=use_async):
+                    result = self.run_tool(handler, '{"town": "x"}', use_async)
+                    self.assertTrue(result["error"].startswith("TypeError"))
+
+
+if __name__ == "__main__":
+    unittest.main()
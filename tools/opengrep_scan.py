@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""
+Run the `pattern-regex` rules of .opengrep/*.yml without the opengrep binary.
+
+All regex rules for a language are compiled into one alternation with a
+named group per rule, so each file is read and scanned once instead of once
+per rule. Findings are the same as running every rule on its own: after a
+hit the scan resumes one character later, rules after the winning branch
+are tried at the same position, and each rule's matches stay
+non-overlapping. Rules written with `pattern`/`pattern-either` need
+opengrep's parser and are listed as skipped.
+
+Before that, a literal prefilter checks which of the strings each rule's
+matches must contain (e.g. "Ocp-Apim-Subscription-Key") occur in the file;
+only rules with a literal present are evaluated, and a file with none is
+skipped outright. The summary line reports how many files were skipped.
+
+Usage:
+    python tools/opengrep_scan.py src/
+    python tools/opengrep_scan.py --json -o scan-results.json .
+    python tools/opengrep_scan.py --compare src/    # check against per-rule passes and time both
+    python tools/opengrep_scan.py --no-prefilter src/
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import time
+
+import yaml
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_RULES = os.path.join(ROOT, ".opengrep")
+
+LANGUAGE_EXTENSIONS = {
+    ".py": "python",
+    ".pyi": "python",
+    ".json": "json",
+    ".yml": "yaml",
+    ".yaml": "yaml"
+}
+
+SKIP_DIRS = {".git", "__pycache__", "node_modules", ".venv", "venv", ".tox"}
+
+# Backreferences and inline global flags change meaning inside a bigger pattern
+STANDALONE_SYNTAX = re.compile(r"\\[1-9]|\(\?P=|\(\?[aiLmsux]+\)")
+
+
+def first_chars(pattern):
+    """
+    The characters a match of `pattern` can start with, or None when that
+    cannot be bounded (case-insensitive flags, classes like \\w, optional
+    leading parts, etc.).
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error:
+        return None
+    if parsed.state.flags & re.IGNORECASE:
+        return None
+    return _first_chars(list(parsed))
+
+
+def _first_chars(items):
+    for op, av in items:
+        if op is sre_parse.AT:
+            continue  # \b, ^ and friends consume nothing
+        if op is sre_parse.LITERAL:
+            return {chr(av)}
+        if op is sre_parse.IN:
+            chars = set()
+            for item_op, item_av in av:
+                if item_op is sre_parse.LITERAL:
+                    chars.add(chr(item_av))
+                elif item_op is sre_parse.RANGE and item_av[1] - item_av[0] < 256:
+                    chars.update(map(chr, range(item_av[0], item_av[1] + 1)))
+                else:
+                    return None
+            return chars
+        if op is sre_parse.SUBPATTERN:
+            if av[1] & re.IGNORECASE:
+                return None  # a scoped (?i:...) group
+            return _first_chars(list(av[-1]))
+        if op is sre_parse.BRANCH:
+            chars = set()
+            for branch in av[1]:
+                branch_chars = _first_chars(list(branch))
+                if branch_chars is None:
+                    return None
+                chars |= branch_chars
+            return chars
+        if op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[0] >= 1:
+            return _first_chars(list(av[2]))
+        return None
+    return None
+
+
+def required_literals(pattern):
+    """
+    A set of strings at least one of which every match of `pattern`
+    contains, or None when no such set can be derived.
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except re.error:
+        return None
+    if parsed.state.flags & re.IGNORECASE:
+        return None
+    return _required_literals(list(parsed))
+
+
+def _required_literals(items):
+    candidates, run = [], []
+    for op, av in items + [(None, None)]:
+        if op is sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+        if run:
+            candidates.append({"".join(run)})
+            run = []
+        if op is sre_parse.SUBPATTERN:
+            # A scoped (?i:...) group can match any casing of its literals
+            if not av[1] & re.IGNORECASE:
+                candidates.append(_required_literals(list(av[-1])))
+        elif op is sre_parse.BRANCH:
+            branches = [_required_literals(list(branch)) for branch in av[1]]
+            if all(branches):
+                candidates.append(set().union(*branches))
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[0] >= 1:
+            candidates.append(_required_literals(list(av[2])))
+    candidates = [candidate for candidate in candidates if candidate]
+    if not candidates:
+        return None
+    # The most selective choice: longest shortest literal, then fewest alternatives
+    return max(candidates, key=lambda candidate: (min(map(len, candidate)), -len(candidate)))
+
+
+class LiteralIndex:
+    """
+    Finds which of a fixed set of literals occur in a text.
+
+    Each distinct literal is searched once with str's C substring search,
+    which in CPython beats a per-character Aho-Corasick walk or a regex
+    alternation of the literals. As in Aho-Corasick's dictionary links,
+    a literal containing a shorter one is only searched when that shorter
+    literal was found.
+    """
+
+    def __init__(self, literals):
+        self.literals = sorted(set(literals), key=lambda literal: (len(literal), literal))
+        self.contains = {
+            literal: [shorter for shorter in self.literals[:i] if shorter in literal]
+            for i, literal in enumerate(self.literals)
+        }
+
+    def present(self, text):
+        found = set()
+        for literal in self.literals:
+            if all(shorter in found for shorter in self.contains[literal]) and literal in text:
+                found.add(literal)
+        return found
+
+
+class Rule:
+    def __init__(self, rule_id, pattern, message, severity, languages, source):
+        self.id = rule_id
+        self.pattern = pattern
+        self.regex = re.compile(pattern)
+        self.literals = required_literals(pattern)
+        self.message = message
+        self.severity = severity
+        self.languages = languages
+        self.source = source
+
+
+def load_rules(paths):
+    """
+    Load the regex rules from rule files or directories of them. Returns the
+    rules and the ids of rules skipped for not being `pattern-regex`. A rule
+    repeated with the same id and pattern in several files is kept once.
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*.yml")) + glob.glob(os.path.join(path, "*.yaml"))))
+        else:
+            files.append(path)
+    rules, skipped, seen = [], [], set()
+    for path in files:
+        with open(path, encoding="utf-8") as f:
+            document = yaml.safe_load(f) or {}
+        for entry in document.get("rules", []):
+            pattern = entry.get("pattern-regex")
+            if pattern is None:
+                skipped.append(entry.get("id"))
+                continue
+            if (entry["id"], pattern) in seen:
+                continue
+            seen.add((entry["id"], pattern))
+            rules.append(Rule(
+                entry["id"], pattern, entry.get("message", ""), entry.get("severity", "INFO"),
+                entry.get("languages", []), path
+            ))
+    return rules, skipped
+
+
+class RuleSet:
+    """
+    The rules of one language, compiled into a single alternation.
+
+    The alternation is led by a lookahead on the characters any rule can
+    start with: re only skips ahead on a leading literal or character class,
+    so without it every position of the file would try every branch.
+    """
+
+    def __init__(self, rules):
+        self.rules = [rule for rule in rules if not STANDALONE_SYNTAX.search(rule.pattern)]
+        self.standalone = [rule for rule in rules if STANDALONE_SYNTAX.search(rule.pattern)]
+        self.combined = None
+        if self.rules:
+            alternation = "|".join(f"(?P<r{i}>{rule.pattern})" for i, rule in enumerate(self.rules))
+            starts = [first_chars(rule.pattern) for rule in self.rules]
+            if all(chars is not None for chars in starts):
+                leading = "".join(sorted(re.escape(char) for char in set().union(*starts)))
+                alternation = f"(?=[{leading}])(?:{alternation})"
+            self.combined = re.compile(alternation)
+
+    def scan(self, text):
+        """Yield `(rule, start, end)` for every match of every rule, in one pass over `text`."""
+        if self.combined is not None:
+            ends = [0] * len(self.rules)
+            pos = 0
+            while True:
+                match = self.combined.search(text, pos)
+                if match is None:
+                    break
+                start = match.start()
+                first = int(match.lastgroup[1:])
+                if start >= ends[first]:
+                    ends[first] = match.end()
+                    yield self.rules[first], start, match.end()
+                # Branches after the winning one may match at the same position too
+                for i in range(first + 1, len(self.rules)):
+                    if start >= ends[i]:
+                        other = self.rules[i].regex.match(text, start)
+                        if other is not None:
+                            ends[i] = other.end()
+                            yield self.rules[i], start, other.end()
+                pos = start + 1
+        for rule in self.standalone:
+            for match in rule.regex.finditer(text):
+                yield rule, match.start(), match.end()
+
+
+class Scanner:
+    """
+    Scans files with the rules for their language.
+
+    Args:
+        rules (list): Rules from load_rules.
+        prefilter (bool, optional): Evaluate only the rules whose required
+            literals occur in a file, skipping files with none. Defaults to True.
+    """
+
+    def __init__(self, rules, prefilter=True):
+        languages = {language for rule in rules for language in rule.languages}
+        self.rules = {language: [rule for rule in rules if language in rule.languages] for language in languages}
+        self.prefilter = prefilter
+        self.indexes = {
+            language: LiteralIndex(literal for rule in applicable if rule.literals for literal in rule.literals)
+            for language, applicable in self.rules.items()
+        }
+        self.rulesets = {}
+        self.stats = {"files": 0, "skipped": 0, "bytes": 0, "rules_applicable": 0, "rules_evaluated": 0, "findings": 0}
+
+    def language(self, path):
+        return LANGUAGE_EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+    def ruleset(self, language, rules):
+        key = (language, tuple(rule.id for rule in rules))
+        if key not in self.rulesets:
+            self.rulesets[key] = RuleSet(rules)
+        return self.rulesets[key]
+
+    def scan_file(self, path):
+        language = self.language(path)
+        applicable = self.rules.get(language)
+        if not applicable:
+            return []
+        with open(path, encoding="utf-8", errors="replace") as f:
+            text = f.read()
+        self.stats["files"] += 1
+        self.stats["bytes"] += len(text)
+        self.stats["rules_applicable"] += len(applicable)
+        if self.prefilter:
+            present = self.indexes[language].present(text)
+            applicable = [rule for rule in applicable if rule.literals is None or rule.literals & present]
+            if not applicable:
+                self.stats["skipped"] += 1
+                return []
+        self.stats["rules_evaluated"] += len(applicable)
+        ruleset = self.ruleset(language, applicable)
+        findings = [finding(path, text, rule, start, end) for rule, start, end in ruleset.scan(text)]
+        self.stats["findings"] += len(findings)
+        return findings
+
+    def scan_paths(self, paths):
+        findings = []
+        for path in iter_files(paths):
+            findings.extend(self.scan_file(path))
+        return findings
+
+
+def iter_files(paths):
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        for directory, dirnames, filenames in os.walk(path):
+            dirnames[:] = sorted(name for name in dirnames if name not in SKIP_DIRS)
+            for filename in sorted(filenames):
+                yield os.path.join(directory, filename)
+
+
+def finding(path, text, rule, start, end):
+    line = text.count("\n", 0, start) + 1
+    line_start = text.rfind("\n", 0, start) + 1
+    line_end = text.find("\n", start)
+    return {
+        "check_id": rule.id,
+        "path": path,
+        "start": {"line": line, "col": start - line_start + 1, "offset": start},
+        "end": {"offset": end},
+        "extra": {
+            "message": rule.message,
+            "severity": rule.severity,
+            "lines": text[line_start:line_end if line_end >= 0 else len(text)]
+        }
+    }
+
+
+def per_rule_scan(rules, paths):
+    """Reference implementation: one finditer pass per rule and file."""
+    findings = []
+    for path in iter_files(paths):
+        language = LANGUAGE_EXTENSIONS.get(os.path.splitext(path)[1].lower())
+        applicable = [rule for rule in rules if language in rule.languages]
+        if not applicable:
+            continue
+        with open(path, encoding="utf-8", errors="replace") as f:
+            text = f.read()
+        for rule in applicable:
+            findings.extend(finding(path, text, rule, match.start(), match.end()) for match in rule.regex.finditer(text))
+    return findings
+
+
+def sort_key(item):
+    return item["path"], item["start"]["offset"], item["check_id"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", default=["."])
+    parser.add_argument("-f", "--rules", action="append", help="rule file or directory (default .opengrep/)")
+    parser.add_argument("--json", action="store_true", help="print opengrep-style JSON")
+    parser.add_argument("-o", "--output", help="write the report here instead of stdout")
+    parser.add_argument("--compare", action="store_true", help="check against per-rule passes and time both")
+    parser.add_argument("--no-prefilter", action="store_true", help="evaluate every rule on every file")
+    args = parser.parse_args()
+
+    rules, skipped = load_rules(args.rules or [DEFAULT_RULES])
+    scanner = Scanner(rules, prefilter=not args.no_prefilter)
+    started = time.perf_counter()
+    findings = sorted(scanner.scan_paths(args.paths), key=sort_key)
+    elapsed = time.perf_counter() - started
+
+    if args.json:
+        report = json.dumps({"results": findings, "errors": [], "skipped_rules": skipped}, indent=2)
+    else:
+        lines = [
+            f"{item['path']}:{item['start']['line']}:{item['start']['col']}: "
+            f"{item['extra']['severity']} [{item['check_id']}] {item['extra']['message']}"
+            for item in findings
+        ]
+        lines.append(
+            f"{len(findings)} findings from {len(rules)} regex rules in {scanner.stats['files']} files "
+            f"({elapsed * 1000:.1f} ms)"
+        )
+        if scanner.prefilter and scanner.stats["files"]:
+            lines.append(
+                f"prefilter skipped {scanner.stats['skipped']} of {scanner.stats['files']} files "
+                f"({scanner.stats['skipped'] / scanner.stats['files']:.0%}); "
+                f"{scanner.stats['rules_evaluated']} of {scanner.stats['rules_applicable']} rule evaluations"
+            )
+        if skipped:
+            lines.append(f"skipped non-regex rules: {', '.join(skipped)}")
+        report = "\n".join(lines)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+    if args.compare:
+        started = time.perf_counter()
+        reference = sorted(per_rule_scan(rules, args.paths), key=sort_key)
+        reference_elapsed = time.perf_counter() - started
+        same = reference == findings
+        print(
+            f"per-rule passes: {reference_elapsed * 1000:.1f} ms, combined: {elapsed * 1000:.1f} ms, "
+            f"findings {'identical' if same else 'DIFFER'}",
+            file=sys.stderr
+        )
+        return 0 if same else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())